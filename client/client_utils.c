@@ -67,6 +67,10 @@ int client_connect(const char *ip, unsigned short port)
         return -1;
     }
 
+    // Chat là request/response nhỏ: tắt Nagle để mỗi request đi ngay
+    int one = 1;
+    setsockopt(s, IPPROTO_TCP, TCP_NODELAY, &one, sizeof(one));
+
     return s;
 }
 
@@ -94,11 +98,37 @@ int send_line(int sock, const char *line)
 {
     if (!line)
         return -1;
-    if (send(sock, line, (int)strlen(line), 0) <= 0)
-        return -1;
-    if (send(sock, "\r\n", 2, 0) <= 0)
-        return -1;
-    return 0;
+
+    // Ghép line + "\r\n" vào 1 buffer (stack 1KB, lớn hơn thì malloc)
+    // để cả request đi trong 1 segment thay vì 2 lần send()
+    size_t len = strlen(line);
+    size_t total = len + 2;
+    char stack_buf[1024];
+    char *buf = stack_buf;
+    if (total > sizeof(stack_buf)) {
+        buf = (char *)malloc(total);
+        if (!buf)
+            return -1;
+    }
+    memcpy(buf, line, len);
+    buf[len] = '\r';
+    buf[len + 1] = '\n';
+
+    // send() có thể gửi thiếu => lặp đến khi gửi hết
+    int rc = 0;
+    size_t sent = 0;
+    while (sent < total) {
+        ssize_t n = send(sock, buf + sent, total - sent, 0);
+        if (n <= 0) {
+            rc = -1;
+            break;
+        }
+        sent += (size_t)n;
+    }
+
+    if (buf != stack_buf)
+        free(buf);
+    return rc;
 }
 
 // ============ Key-Value Parser ============
@@ -11,6 +11,9 @@
  * - Nếu không gặp "\r\n" mà buffer vượt ~64KB => coi là dòng quá dài.
  */
 
+// Số byte tối đa đọc mỗi lần recv().
+#define FRAMER_RECV_CHUNK 4096
+
 static int ensure_capacity(LineFramer* framer, size_t need)
 {
     if (need <= framer->cap) return 0;
@@ -40,6 +43,7 @@ int framer_init(LineFramer* framer, size_t initial_cap)
     if (!framer->data) return -1;
     framer->cap = initial_cap;
     framer->len = 0;
+    framer->scan = 0;
     return 0;
 }
 
@@ -54,16 +58,20 @@ void framer_free(LineFramer* framer)
     framer->data = NULL;
     framer->len = 0;
     framer->cap = 0;
+    framer->scan = 0;
 }
 
 static char* find_crlf(LineFramer* framer)
 {
     if (framer->len < 2) return NULL;
-    for (size_t i = 0; i + 1 < framer->len; i++) {
+    for (size_t i = framer->scan; i + 1 < framer->len; i++) {
         if (framer->data[i] == '\r' && framer->data[i + 1] == '\n') {
             return framer->data + i;
         }
     }
+    // Không thấy: lần sau chỉ cần quét phần mới nhận (giữ lại byte cuối
+    // phòng trường hợp "\r" và "\n" rơi vào 2 lần recv khác nhau).
+    framer->scan = framer->len - 1;
     return NULL;
 }
 
@@ -89,6 +97,7 @@ int framer_pop_line(LineFramer* framer, char* out, size_t out_cap)
     size_t remain = framer->len - (line_len + 2);
     memmove(framer->data, crlf + 2, remain);
     framer->len = remain;
+    framer->scan = 0;
 
     return 1;
 }
@@ -109,13 +118,13 @@ int framer_recv_line(int sock, LineFramer* framer, char* out, size_t out_cap)
         if (popped == 1) return (int)strlen(out);
         if (popped < 0) return popped;
 
-        char tmp[512];
-        int r = (int)recv(sock, tmp, (int)sizeof(tmp), 0);
+        // recv thẳng vào phần trống của buffer (không qua tmp 512 byte + memcpy):
+        // dòng dài (Base64 vài KB) chỉ cần 1-2 lần recv thay vì hàng chục lần.
+        if (ensure_capacity(framer, framer->len + FRAMER_RECV_CHUNK + 1) != 0) return -1;
+        int r = (int)recv(sock, framer->data + framer->len, FRAMER_RECV_CHUNK, 0);
         if (r == 0) return 0;
         if (r < 0) return -1;
 
-        if (ensure_capacity(framer, framer->len + (size_t)r + 1) != 0) return -1;
-        memcpy(framer->data + framer->len, tmp, (size_t)r);
         framer->len += (size_t)r;
         framer->data[framer->len] = 0;
 
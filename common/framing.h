@@ -14,6 +14,8 @@ typedef struct {
     char* data;
     size_t len;
     size_t cap;
+    // Vị trí bắt đầu tìm "\r\n" lần tới (các byte trước đó đã quét, không có delimiter)
+    size_t scan;
 } LineFramer;
 
 // Khởi tạo/giải phóng bộ đệm của framer.
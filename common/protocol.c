@@ -93,6 +93,8 @@ void proto_free(ProtoMsg* msg)
  * proto_send_ok
  * - Gửi response OK theo format: "OK <req_id> <payload>\r\n".
  * - Nếu payload NULL/"" thì chỉ gửi "OK <req_id>\r\n".
+ * - Ghép cả dòng vào 1 buffer rồi send 1 lần: gửi 3 mảnh nhỏ liên tiếp
+ *   (header, payload, \r\n) dễ dính Nagle + delayed ACK ở phía client.
  */
 int proto_send_ok(int sock, const char* req_id, const char* payload)
 {
@@ -103,12 +105,22 @@ int proto_send_ok(int sock, const char* req_id, const char* payload)
         snprintf(header, sizeof(header), "OK %s", req_id);
     }
 
-    if (send_all(sock, header, strlen(header)) != 0) return -1;
-    if (payload && payload[0]) {
-        if (send_all(sock, payload, strlen(payload)) != 0) return -1;
-    }
-    if (send_all(sock, "\r\n", 2) != 0) return -1;
-    return 0;
+    size_t hlen = strlen(header);
+    size_t plen = payload ? strlen(payload) : 0;
+    size_t total = hlen + plen + 2;
+
+    // Response ngắn dùng buffer trên stack, dài (history...) mới malloc
+    char small[1024];
+    char* line = total <= sizeof(small) ? small : (char*)malloc(total);
+    if (!line) return -1;
+
+    memcpy(line, header, hlen);
+    if (plen) memcpy(line + hlen, payload, plen);
+    memcpy(line + hlen + plen, "\r\n", 2);
+
+    int rc = send_all(sock, line, total);
+    if (line != small) free(line);
+    return rc;
 }
 
 /*
@@ -108,29 +108,6 @@ static void compute_password_hash(const char* salt, const char* password, char o
     hex64(fnv1a64(buf), out_hash);
 }
 
-static int read_next_id_unlocked(FILE* f, int* out_next_id)
-{
-    int max_id = 0;
-    char line[512];
-    rewind(f);
-
-    while (fgets(line, sizeof(line), f)) {
-        int id = 0;
-        char username[ACC_USERNAME_MAX + 8];
-        char salt[64];
-        char hash[32];
-        char email[ACC_EMAIL_MAX + 8];
-        int active = 0;
-
-        if (sscanf(line, "%d|%31[^|]|%63[^|]|%31[^|]|%95[^|]|%d", &id, username, salt, hash, email, &active) == 6) {
-            if (id > max_id) max_id = id;
-        }
-    }
-
-    *out_next_id = max_id + 1;
-    return 0;
-}
-
 int accounts_init(const char* db_path)
 {
     // Khởi tạo đường dẫn DB và tạo file nếu chưa tồn tại (thread-safe).
@@ -218,8 +195,9 @@ int accounts_register(const char* username,
         return ACC_ERR_IO;
     }
 
-    // Check duplicate
+    // Check duplicate + tìm max id trong cùng 1 lần scan
     char line[512];
+    int max_id = 0;
     while (fgets(line, sizeof(line), f)) {
         int id = 0;
         char file_user[ACC_USERNAME_MAX + 8];
@@ -234,11 +212,11 @@ int accounts_register(const char* username,
                 pthread_mutex_unlock(&g_accounts_mutex);
                 return ACC_ERR_EXISTS;
             }
+            if (id > max_id) max_id = id;
         }
     }
 
-    int next_id = 1;
-    read_next_id_unlocked(f, &next_id);
+    int next_id = max_id + 1;
 
     char salt[33];
     char hash[17];
@@ -124,6 +124,30 @@ static int is_group_member(int group_id, const char *username)
     return 0;
 }
 
+// Largest group id handed out so far; -1 until loaded from groups.db.
+// Guarded by groups_mutex. Only this process appends to groups.db, so after
+// the one startup scan the in-memory value stays authoritative.
+static int last_group_id = -1;
+
+static int max_group_id(void)
+{
+    FILE *f = fopen(GROUPS_DB_PATH, "r");
+    if (!f)
+        return 0;
+
+    int max_gid = 0;
+    char line[LINE_MAX];
+    while (fgets(line, sizeof(line), f))
+    {
+        int gid;
+        if (sscanf(line, "%d|", &gid) == 1 && gid > max_gid)
+            max_gid = gid;
+    }
+
+    fclose(f);
+    return max_gid;
+}
+
 /* ===== Public APIs ===== */
 
 int groups_create(int owner_user_id,
@@ -139,7 +163,13 @@ int groups_create(int owner_user_id,
 
     pthread_mutex_lock(&groups_mutex);
 
-    int gid = (int)time(NULL); // simple unique id
+    // time-based id, bumped past the largest existing one so that
+    // groups created within the same second still get unique ids
+    if (last_group_id < 0)
+        last_group_id = max_group_id();
+    int gid = (int)time(NULL);
+    if (gid <= last_group_id)
+        gid = last_group_id + 1;
 
     FILE *g = fopen(GROUPS_DB_PATH, "a");
     if (!g)
@@ -151,6 +181,7 @@ int groups_create(int owner_user_id,
     fprintf(g, "%d|%s|%s|%ld\n",
             gid, group_name, owner, time(NULL));
     fclose(g);
+    last_group_id = gid;
 
     FILE *m = fopen(GROUP_MEMBERS_DB_PATH, "a");
     if (m)
@@ -257,6 +257,30 @@ int handle_request(ServerCtx *ctx, const char *line)
         return 0;
     }
 
+#ifdef ITEST
+    // DEBUG_EXPIRE (chỉ có trong bản build test): ép session hết hạn ngay,
+    // để test timeout không phải sleep chờ hết session_timeout thật.
+    if (strcmp(msg.verb, "DEBUG_EXPIRE") == 0)
+    {
+        char token[128];
+        if (!kv_get(msg.payload, "token", token, sizeof(token)))
+        {
+            send_simple_err(ctx->client_sock, msg.req_id, 400, "missing_fields");
+            proto_free(&msg);
+            return 0;
+        }
+
+        int rc = sessions_expire(token);
+        if (rc == SESS_OK)
+            proto_send_ok(ctx->client_sock, msg.req_id, "expired=1");
+        else
+            send_simple_err(ctx->client_sock, msg.req_id, 401, "invalid_token");
+
+        proto_free(&msg);
+        return 0;
+    }
+#endif
+
     // FRIEND_INVITE
     if (strcmp(msg.verb, "FRIEND_INVITE") == 0)
     {
@@ -5,6 +5,7 @@
 #include <pthread.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
+#include <netinet/tcp.h>
 #include <arpa/inet.h>
 
 #include "../common/framing.h"
@@ -21,6 +22,7 @@
  *
  * Usage:
  *   ./build/server <port> [session_timeout_seconds]
+ *   (port=0: OS tự chọn port trống, port thật được in trong dòng "Server listening")
  */
 
 typedef struct {
@@ -122,6 +124,15 @@ int main(int argc, char** argv)
         return 1;
     }
 
+    // port=0 => OS tự chọn port trống; đọc lại port thật để in ra banner.
+    struct sockaddr_in bound;
+    socklen_t blen = sizeof(bound);
+    if (getsockname(s, (struct sockaddr*)&bound, &blen) == 0) {
+        port = ntohs(bound.sin_port);
+    }
+
+    // Dòng này là tín hiệu "sẵn sàng" cho test runner (tests/test_utils.py):
+    // phải in SAU listen() để client connect ngay là được accept.
     printf("Server listening on 0.0.0.0:%d (session_timeout=%ds)\n", (int)port, session_timeout_seconds);
 
     for (;;) {
@@ -130,6 +141,11 @@ int main(int argc, char** argv)
         int c = accept(s, (struct sockaddr*)&caddr, &clen);
         if (c < 0) continue;
 
+        // Chat là request/response nhỏ + PUSH: tắt Nagle để mỗi dòng đi ngay,
+        // không phải chờ ACK của dòng trước.
+        int nodelay = 1;
+        setsockopt(c, IPPROTO_TCP, TCP_NODELAY, &nodelay, sizeof(nodelay));
+
         ClientArgs* args = (ClientArgs*)calloc(1, sizeof(ClientArgs));
         args->sock = c;
         memcpy(&args->addr, &caddr, sizeof(caddr));
@@ -206,6 +206,23 @@ int sessions_destroy(const char* token)
     return SESS_ERR_NOT_FOUND;
 }
 
+int sessions_expire(const char* token)
+{
+    // Dùng cho test: lùi last_activity đúng 1 timeout để lần validate sau báo hết hạn.
+    if (!token || !token[0]) return SESS_ERR_NOT_FOUND;
+
+    pthread_mutex_lock(&g_sess_mutex);
+    for (int i = 0; i < MAX_SESSIONS; i++) {
+        if (g_sessions[i].active && strcmp(g_sessions[i].token, token) == 0) {
+            g_sessions[i].last_activity = time(NULL) - g_timeout;
+            pthread_mutex_unlock(&g_sess_mutex);
+            return SESS_OK;
+        }
+    }
+    pthread_mutex_unlock(&g_sess_mutex);
+    return SESS_ERR_NOT_FOUND;
+}
+
 void sessions_remove_by_socket(int client_socket)
 {
     // Cleanup theo socket (gọi khi client disconnect để tránh session treo).
@@ -30,6 +30,9 @@ int sessions_validate(const char* token, int* out_user_id);
 // Logout: xoá session theo token.
 int sessions_destroy(const char* token);
 
+// Ép session hết hạn ngay (dùng cho test timeout, không cần sleep).
+int sessions_expire(const char* token);
+
 // Xoá session gắn với socket này (gọi khi client disconnect).
 void sessions_remove_by_socket(int client_socket);
 
@@ -0,0 +1,25 @@
+"""
+pytest entry point for the integration suites.
+
+Every test_* function takes a `port` argument. This fixture starts one
+server per pytest session (one per worker under pytest-xdist, each in its
+own temp data directory) and hands its port to every test:
+
+    python3 -m pytest tests -q
+    python3 -m pytest tests -q -n auto --dist loadfile
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(__file__))
+from test_utils import running_server
+
+
+@pytest.fixture(scope="session")
+def port():
+    """Port of the shared test server"""
+    with running_server(timeout_s=3600) as server_port:
+        yield server_port
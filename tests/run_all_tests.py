@@ -3,13 +3,13 @@
 Master Test Runner for ChatProject-IT4062
 
 Runs all test suites and provides summary:
-- Base features (18 tests): Framing, Accounts, Sessions
+- Base features (20 tests): Framing, Accounts, Sessions
 - Friend features (18 tests): Invite, Accept, Reject, List, Delete
 - Group features (19 tests): Create, Add, Remove, Leave, List, Members
 - Private Message features (18 tests): Send, History, Conversations, Real-time
 - Group Message features (19 tests): Send, History, Real-time, Notifications
 
-Total: 92 test cases
+Total: 94 test cases
 
 Usage:
     python3 run_all_tests.py          # Run all tests
@@ -22,13 +22,13 @@ Usage:
 
 import sys
 import os
+import io
 import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 
 sys.path.insert(0, os.path.dirname(__file__))
-from test_utils import (
-    free_port, start_server, stop_server,
-    backup_data, restore_data, section, Colors
-)
+from test_utils import running_server, section, Colors, TestRunner
 
 # Import test modules
 import test_base
@@ -75,43 +75,58 @@ def print_summary(results: dict):
 """)
 
 
+def run_suite_isolated(run_fn):
+    """
+    Run one suite in a worker process against its own server (own port and
+    temp data dir). Output is captured so the parent can print suites in order.
+    """
+    out = io.StringIO()
+    with redirect_stdout(out):
+        try:
+            with running_server(timeout_s=3600) as port:
+                passed, failed = run_fn(port)
+        except SystemExit:
+            # die() exits on the first failing test; keep what already passed.
+            # No active runner means the server never started.
+            runner = TestRunner.active
+            passed = runner.passed if runner else 0
+            failed = max(runner.failed, 1) if runner else 1
+    return passed, failed, out.getvalue()
+
+
 def run_all():
     """Run all test suites"""
     print_banner()
     
-    port = free_port()
     results = {}
     
-    backup_data()
-    proc = start_server(port, timeout_s=3600)
+    suites = [
+        ("Base", test_base.run_all),
+        ("Friends", test_friends.run_all),
+        ("Groups", test_groups.run_all),
+        ("Private Message", test_pm.run_all),
+        ("Group Message", test_gm.run_all),
+    ]
     
-    try:
-        # Run each test suite
-        suites = [
-            ("Base", test_base.run_all),
-            ("Friends", test_friends.run_all),
-            ("Groups", test_groups.run_all),
-            ("Private Message", test_pm.run_all),
-            ("Group Message", test_gm.run_all),
-        ]
+    # Suites mostly wait on sockets and push delays, so running them side by
+    # side cuts wall time to roughly the slowest suite
+    with ProcessPoolExecutor(max_workers=len(suites)) as pool:
+        futures = [(name, pool.submit(run_suite_isolated, run_fn)) for name, run_fn in suites]
         
-        for name, run_fn in suites:
+        for name, future in futures:
             try:
-                passed, failed = run_fn(port)
+                passed, failed, output = future.result()
+                print(output, end="")
                 results[name] = (passed, failed)
             except Exception as e:
                 print(f"{Colors.RED}[ERROR] {name} suite crashed: {e}{Colors.RESET}")
                 results[name] = (0, 1)
-        
-        print_summary(results)
-        
-        # Return exit code
-        total_failed = sum(r[1] for r in results.values())
-        return 0 if total_failed == 0 else 1
-        
-    finally:
-        stop_server(proc)
-        restore_data()
+    
+    print_summary(results)
+    
+    # Return exit code
+    total_failed = sum(r[1] for r in results.values())
+    return 0 if total_failed == 0 else 1
 
 
 def run_single(suite_name: str):
@@ -133,11 +148,7 @@ def run_single(suite_name: str):
     
     print(f"\n{Colors.BOLD}Running {name} Tests...{Colors.RESET}\n")
     
-    port = free_port()
-    backup_data()
-    proc = start_server(port, timeout_s=3600)
-    
-    try:
+    with running_server(timeout_s=3600) as port:
         passed, failed = run_fn(port)
         
         print(f"\n{'='*60}")
@@ -148,10 +159,6 @@ def run_single(suite_name: str):
         print(f"{'='*60}\n")
         
         return 0 if failed == 0 else 1
-        
-    finally:
-        stop_server(proc)
-        restore_data()
 
 
 def main():
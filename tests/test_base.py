@@ -8,31 +8,32 @@ Test Cases:
 2. Framing - Multiple lines in one send
 3. Framing - Overlong line (>64KB) causes disconnect
 4. Server IO - Concurrent PING from multiple clients
-5. Accounts - Register success
-6. Accounts - Register duplicate username (409)
-7. Accounts - Register invalid username (422)
-8. Accounts - Register invalid password (422)
-9. Accounts - Register invalid email (422)
-10. Sessions - Login success
-11. Sessions - Login wrong password (401)
-12. Sessions - Login non-existent user (401)
-13. Sessions - Multi-login blocked (409)
-14. Sessions - Whoami with valid token
-15. Sessions - Whoami with invalid token (401)
-16. Sessions - Logout success
-17. Sessions - Session cleanup on disconnect
-18. Sessions - Session timeout
+5. Server IO - Pipelined PINGs on one connection
+6. Accounts - Register success
+7. Accounts - Register duplicate username (409)
+8. Accounts - Register invalid username (422)
+9. Accounts - Register invalid password (422)
+10. Accounts - Register invalid email (422)
+11. Sessions - Login success
+12. Sessions - Login wrong password (401)
+13. Sessions - Login non-existent user (401)
+14. Sessions - Multi-login blocked (409)
+15. Sessions - Whoami with valid token
+16. Sessions - Whoami with invalid token (401)
+17. Sessions - Logout success
+18. Sessions - Session cleanup on disconnect
+19. Sessions - Session timeout
 """
 
+import asyncio
+import select
 import sys
 import os
 import time
-import threading
 
 sys.path.insert(0, os.path.dirname(__file__))
 from test_utils import (
-    Conn, free_port, start_server, stop_server,
-    backup_data, restore_data, parse_resp, parse_kv,
+    Conn, running_server, parse_resp, parse_kv, wait_for,
     ok, die, info, section, TestRunner
 )
 
@@ -43,11 +44,13 @@ def test_framing_split_bytes(port: int):
     """Send PING byte by byte - server should reassemble"""
     c = Conn(port=port)
     
-    # Send "PING 1\r\n" one byte at a time
+    # Send "PING 1\r\n" one byte at a time. Conn sets TCP_NODELAY, so each byte
+    # leaves as its own segment; a 1ms gap is ample for the server thread to
+    # recv() it before the next one arrives (loopback wakeups take microseconds)
     data = b"PING 1\r\n"
     for byte in data:
         c.sock.sendall(bytes([byte]))
-        time.sleep(0.01)
+        time.sleep(0.001)
     
     resp = c.recv_line()
     kind, rid, rest = parse_resp(resp)
@@ -81,60 +84,84 @@ def test_framing_overlong_line(port: int):
     """Send line > 64KB - server should disconnect"""
     c = Conn(port=port)
     
-    # Send 70KB of data without \r\n
+    # Send 70KB of data without \r\n; the server may drop us mid-send
     try:
         c.sock.sendall(b"A" * 70000)
-        time.sleep(0.5)
-        c.sock.sendall(b"B" * 1000)
-        time.sleep(0.5)
-        
-        # Try to receive - should get disconnected
-        c.sock.settimeout(2)
-        data = c.sock.recv(1024)
-        
-        # If we get here, either disconnected (empty) or error response
-        # Both are acceptable
-        if data:
-            # Server might send error before closing
-            pass
-    except (ConnectionResetError, BrokenPipeError, EOFError):
-        pass  # Expected - server closed connection
-    except Exception:
+    except (ConnectionResetError, BrokenPipeError):
         pass
     
+    # select() wakes as soon as FIN/RST arrives instead of sleeping a fixed time.
+    # The server might send an error line before closing, so read until EOF.
+    closed = False
+    deadline = time.monotonic() + 2.0
+    while not closed:
+        remaining = deadline - time.monotonic()
+        readable, _, _ = select.select([c.sock], [], [], max(remaining, 0))
+        if not readable:
+            break
+        try:
+            closed = c.sock.recv(4096) == b""
+        except (ConnectionResetError, BrokenPipeError):
+            closed = True
+    
+    assert closed, "Server should close the connection after an overlong line"
+    
     c.close()
 
 
 def test_concurrent_ping(port: int):
     """Multiple clients sending PING concurrently"""
     NUM_CLIENTS = 10
-    results = []
-    errors = []
-    
-    def ping_client(client_id):
+    NUM_PINGS = 30
+    
+    # A single event loop drives every client (no thread per client); each
+    # PING borrows one of the pre-opened connections from the pool
+    async def run():
+        conns = await asyncio.gather(
+            *(asyncio.open_connection("127.0.0.1", port) for _ in range(NUM_CLIENTS))
+        )
+        pool = asyncio.Queue()
+        for conn in conns:
+            pool.put_nowait(conn)
+        
+        async def ping_client(ping_id):
+            reader, writer = await pool.get()
+            try:
+                writer.write(f"PING {ping_id}\r\n".encode())
+                await writer.drain()
+                line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout=3)
+                kind, rid, _ = parse_resp(line.decode())
+                if kind != "OK" or rid != str(ping_id):
+                    return f"PING {ping_id}: unexpected response {line!r}"
+                return None
+            finally:
+                pool.put_nowait((reader, writer))
+        
         try:
-            c = Conn(port=port)
-            c.send_line(f"PING {client_id}")
-            resp = c.recv_line()
-            kind, rid, _ = parse_resp(resp)
-            if kind == "OK" and rid == str(client_id):
-                results.append(client_id)
-            else:
-                errors.append(f"Client {client_id}: unexpected response {resp}")
-            c.close()
-        except Exception as e:
-            errors.append(f"Client {client_id}: {e}")
-    
-    threads = []
-    for i in range(NUM_CLIENTS):
-        t = threading.Thread(target=ping_client, args=(i,))
-        threads.append(t)
-        t.start()
-    
-    for t in threads:
-        t.join(timeout=5)
-    
-    assert len(results) == NUM_CLIENTS, f"Only {len(results)}/{NUM_CLIENTS} succeeded. Errors: {errors}"
+            results = await asyncio.gather(*(ping_client(i) for i in range(NUM_PINGS)))
+        finally:
+            for _, writer in conns:
+                writer.close()
+        return [e for e in results if e]
+    
+    errors = asyncio.run(run())
+    
+    assert not errors, f"{len(errors)}/{NUM_PINGS} PINGs failed. Errors: {errors}"
+
+
+def test_pipelined_pings(port: int):
+    """Many PINGs pipelined on one connection, answered in order"""
+    NUM_PINGS = 30
+    c = Conn(port=port)
+    
+    responses = c.pipeline([f"PING {1000 + i}" for i in range(NUM_PINGS)])
+    
+    for i, resp in enumerate(responses):
+        kind, rid, rest = parse_resp(resp)
+        assert kind == "OK", f"Expected OK for PING {1000 + i}, got {resp}"
+        assert rid == str(1000 + i), f"Expected rid={1000 + i}, got {rid}"
+    
+    c.close()
 
 
 # ============ Account Tests ============
@@ -222,8 +249,7 @@ def test_login_success(port: int):
     """Login with correct credentials"""
     c = Conn(port=port)
     
-    c.register("loginuser", "password123", "login@example.com")
-    kind, rid, rest, token = c.login("loginuser", "password123")
+    kind, rid, rest, token = c.register_and_login("loginuser", "password123", "login@example.com")
     
     assert kind == "OK", f"Expected OK, got {kind}: {rest}"
     assert token, "No token returned"
@@ -263,10 +289,8 @@ def test_multi_login_blocked(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("multiuser", "password123", "multi@example.com")
-    
-    # First login
-    kind1, _, _, token1 = c1.login("multiuser", "password123")
+    # Register + first login
+    kind1, _, _, token1 = c1.register_and_login("multiuser", "password123", "multi@example.com")
     assert kind1 == "OK", "First login should succeed"
     
     # Second login from different connection
@@ -282,8 +306,7 @@ def test_whoami_valid_token(port: int):
     """Whoami with valid token"""
     c = Conn(port=port)
     
-    c.register("whoamiuser", "password123", "whoami@example.com")
-    kind, _, _, token = c.login("whoamiuser", "password123")
+    kind, _, _, token = c.register_and_login("whoamiuser", "password123", "whoami@example.com")
     assert kind == "OK"
     
     kind, rid, rest = c.whoami(token)
@@ -312,8 +335,7 @@ def test_logout_success(port: int):
     """Logout invalidates token"""
     c = Conn(port=port)
     
-    c.register("logoutuser", "password123", "logout@example.com")
-    _, _, _, token = c.login("logoutuser", "password123")
+    _, _, _, token = c.register_and_login("logoutuser", "password123", "logout@example.com")
     
     # Logout
     kind, _, rest = c.logout(token)
@@ -331,26 +353,36 @@ def test_session_cleanup_on_disconnect(port: int):
     """Session cleaned up when client disconnects"""
     c1 = Conn(port=port)
     
-    c1.register("disconnuser", "password123", "disconn@example.com")
-    _, _, _, token = c1.login("disconnuser", "password123")
+    _, _, _, token = c1.register_and_login("disconnuser", "password123", "disconn@example.com")
     
     # Disconnect without logout
     c1.close()
-    time.sleep(0.5)  # Give server time to cleanup
     
-    # Should be able to login again from new connection
+    # Should be able to login again from new connection; retry so we proceed
+    # as soon as the server has cleaned up the old session
     c2 = Conn(port=port)
-    kind, _, _, _ = c2.login("disconnuser", "password123")
-    assert kind == "OK", "Should be able to login after disconnect"
+    logged_in = wait_for(lambda: c2.login("disconnuser", "password123")[0] == "OK")
+    assert logged_in, "Should be able to login after disconnect"
     
     c2.close()
 
 
 def test_session_timeout(port: int):
     """Session expires after timeout"""
-    # This test needs a server started with short timeout
-    # We'll skip detailed implementation as it requires server restart
-    pass  # Tested in itest.py with special server config
+    c = Conn(port=port)
+    
+    kind, _, _, token = c.register_and_login("timeoutuser", "password123", "timeout@example.com")
+    assert kind == "OK", "Login should succeed"
+    
+    # Fast-forward this session past the timeout instead of sleeping through it
+    kind, _, rest = c.debug_expire(token)
+    assert kind == "OK", f"DEBUG_EXPIRE should succeed: {rest}"
+    
+    kind, _, rest = c.whoami(token)
+    assert kind == "ERR", "Token should be invalid after timeout"
+    assert "401" in rest, f"Expected 401, got {rest}"
+    
+    c.close()
 
 
 # ============ Main ============
@@ -364,6 +396,7 @@ def run_all(port: int):
     runner.add_test(test_framing_multiple_lines, "Framing: multiple lines in one send")
     runner.add_test(test_framing_overlong_line, "Framing: overlong line disconnect")
     runner.add_test(test_concurrent_ping, "Server IO: concurrent PING")
+    runner.add_test(test_pipelined_pings, "Server IO: pipelined PING")
     
     # Account tests
     runner.add_test(test_register_success, "Accounts: register success")
@@ -382,25 +415,18 @@ def run_all(port: int):
     runner.add_test(test_whoami_invalid_token, "Sessions: whoami invalid token (401)")
     runner.add_test(test_logout_success, "Sessions: logout success")
     runner.add_test(test_session_cleanup_on_disconnect, "Sessions: cleanup on disconnect")
+    runner.add_test(test_session_timeout, "Sessions: session timeout")
     
     return runner.run(port)
 
 
 def main():
-    port = free_port()
-    
-    backup_data()
-    proc = start_server(port, timeout_s=3600)
-    
-    try:
+    with running_server(timeout_s=3600) as port:
         passed, failed = run_all(port)
         print(f"\n{'='*60}")
         print(f"Base Tests: {passed} passed, {failed} failed")
         print(f"{'='*60}")
         return 0 if failed == 0 else 1
-    finally:
-        stop_server(proc)
-        restore_data()
 
 
 if __name__ == "__main__":
@@ -26,12 +26,10 @@ Test Cases:
 
 import sys
 import os
-import time
 
 sys.path.insert(0, os.path.dirname(__file__))
 from test_utils import (
-    Conn, free_port, start_server, stop_server,
-    backup_data, restore_data, parse_resp, parse_kv,
+    Conn, running_server, parse_resp, parse_kv,
     ok, die, info, section, TestRunner
 )
 
@@ -41,27 +39,23 @@ from test_utils import (
 def test_invite_success(port: int):
     """Send friend invite successfully"""
     c1 = Conn(port=port)
-    c2 = Conn(port=port)
-    
-    c1.register("inviter", "password123", "inviter@test.com")
-    c2.register("invitee", "password123", "invitee@test.com")
     
-    c1.login("inviter", "password123")
+    c1.register_and_login("inviter", "password123", "inviter@test.com")
+    # REGISTER needs no session, so the peer is created on the same connection
+    c1.register("invitee", "password123", "invitee@test.com")
     
     kind, _, rest = c1.friend_invite("invitee")
     
     assert kind == "OK", f"Expected OK, got {kind}: {rest}"
     
     c1.close()
-    c2.close()
 
 
 def test_invite_nonexistent_user(port: int):
     """Invite non-existent user - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("lonely", "password123", "lonely@test.com")
-    c.login("lonely", "password123")
+    c.register_and_login("lonely", "password123", "lonely@test.com")
     
     kind, _, rest = c.friend_invite("nosuchuser")
     
@@ -75,8 +69,7 @@ def test_invite_self(port: int):
     """Invite self - should fail with 400 or 422"""
     c = Conn(port=port)
     
-    c.register("narcissist", "password123", "narc@test.com")
-    c.login("narcissist", "password123")
+    c.register_and_login("narcissist", "password123", "narc@test.com")
     
     kind, _, rest = c.friend_invite("narcissist")
     
@@ -92,11 +85,8 @@ def test_invite_already_friend(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("friend1", "password123", "f1@test.com")
-    c2.register("friend2", "password123", "f2@test.com")
-    
-    c1.login("friend1", "password123")
-    c2.login("friend2", "password123")
+    c1.register_and_login("friend1", "password123", "f1@test.com")
+    c2.register_and_login("friend2", "password123", "f2@test.com")
     
     # Send and accept invite
     c1.friend_invite("friend2")
@@ -115,12 +105,9 @@ def test_invite_already_friend(port: int):
 def test_invite_already_pending(port: int):
     """Invite when already pending - should fail with 409"""
     c1 = Conn(port=port)
-    c2 = Conn(port=port)
-    
-    c1.register("pend1", "password123", "p1@test.com")
-    c2.register("pend2", "password123", "p2@test.com")
     
-    c1.login("pend1", "password123")
+    c1.register_and_login("pend1", "password123", "p1@test.com")
+    c1.register("pend2", "password123", "p2@test.com")
     
     # Send first invite
     c1.friend_invite("pend2")
@@ -132,15 +119,12 @@ def test_invite_already_pending(port: int):
     assert "409" in rest, f"Expected 409 error, got {rest}"
     
     c1.close()
-    c2.close()
 
 
 def test_invite_invalid_token(port: int):
     """Invite with invalid token - should fail with 401"""
     c = Conn(port=port)
     
-    c.register("tokuser", "password123", "tok@test.com")
-    
     kind, _, rest = c.friend_invite("someone", token="invalid_token_123456789012345")
     
     assert kind == "ERR", f"Expected ERR, got {kind}"
@@ -156,11 +140,8 @@ def test_pending_list(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("sender1", "password123", "s1@test.com")
-    c2.register("receiver1", "password123", "r1@test.com")
-    
-    c1.login("sender1", "password123")
-    c2.login("receiver1", "password123")
+    c1.register_and_login("sender1", "password123", "s1@test.com")
+    c2.register_and_login("receiver1", "password123", "r1@test.com")
     
     # sender1 invites receiver1
     c1.friend_invite("receiver1")
@@ -180,8 +161,7 @@ def test_pending_empty(port: int):
     """Pending list is empty"""
     c = Conn(port=port)
     
-    c.register("nopending", "password123", "np@test.com")
-    c.login("nopending", "password123")
+    c.register_and_login("nopending", "password123", "np@test.com")
     
     kind, _, rest = c.friend_pending()
     
@@ -200,11 +180,8 @@ def test_accept_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("acc_s", "password123", "acc_s@test.com")
-    c2.register("acc_r", "password123", "acc_r@test.com")
-    
-    c1.login("acc_s", "password123")
-    c2.login("acc_r", "password123")
+    c1.register_and_login("acc_s", "password123", "acc_s@test.com")
+    c2.register_and_login("acc_r", "password123", "acc_r@test.com")
     
     c1.friend_invite("acc_r")
     
@@ -227,8 +204,7 @@ def test_accept_nonexistent(port: int):
     """Accept non-existent invite - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("acc_fail", "password123", "accf@test.com")
-    c.login("acc_fail", "password123")
+    c.register_and_login("acc_fail", "password123", "accf@test.com")
     
     kind, _, rest = c.friend_accept("nosuchuser")
     
@@ -245,11 +221,8 @@ def test_reject_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("rej_s", "password123", "rej_s@test.com")
-    c2.register("rej_r", "password123", "rej_r@test.com")
-    
-    c1.login("rej_s", "password123")
-    c2.login("rej_r", "password123")
+    c1.register_and_login("rej_s", "password123", "rej_s@test.com")
+    c2.register_and_login("rej_r", "password123", "rej_r@test.com")
     
     c1.friend_invite("rej_r")
     
@@ -273,8 +246,7 @@ def test_reject_nonexistent(port: int):
     """Reject non-existent invite - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("rej_fail", "password123", "rejf@test.com")
-    c.login("rej_fail", "password123")
+    c.register_and_login("rej_fail", "password123", "rejf@test.com")
     
     kind, _, rest = c.friend_reject("nosuchuser")
     
@@ -291,11 +263,8 @@ def test_list_with_status(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("list_a", "password123", "la@test.com")
-    c2.register("list_b", "password123", "lb@test.com")
-    
-    c1.login("list_a", "password123")
-    c2.login("list_b", "password123")
+    c1.register_and_login("list_a", "password123", "la@test.com")
+    c2.register_and_login("list_b", "password123", "lb@test.com")
     
     # Make friends
     c1.friend_invite("list_b")
@@ -316,8 +285,7 @@ def test_list_empty(port: int):
     """Friend list is empty"""
     c = Conn(port=port)
     
-    c.register("nofriends", "password123", "nf@test.com")
-    c.login("nofriends", "password123")
+    c.register_and_login("nofriends", "password123", "nf@test.com")
     
     kind, _, rest = c.friend_list()
     
@@ -335,29 +303,31 @@ def test_list_online_offline(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("stat_a", "password123", "sta@test.com")
-    c2.register("stat_b", "password123", "stb@test.com")
-    
-    c1.login("stat_a", "password123")
-    c2.login("stat_b", "password123")
+    c1.register_and_login("stat_a", "password123", "sta@test.com")
+    c2.register_and_login("stat_b", "password123", "stb@test.com")
     
     # Make friends
     c1.friend_invite("stat_b")
     c2.friend_accept("stat_a")
     
-    # stat_b goes offline
+    # stat_b goes offline; LOGOUT drops the session before replying,
+    # so the socket can stay open and be reused for the next login
     c2.logout()
-    c2.close()
-    time.sleep(0.3)
     
-    # Check stat_b is offline
     kind, _, rest = c1.friend_list()
+    assert kind == "OK"
+    assert "offline" in rest.lower(), f"stat_b should show offline: {rest}"
+    
+    # stat_b comes back on the same socket
+    kind, _, rest, _ = c2.login("stat_b", "password123")
+    assert kind == "OK", f"Re-login on the same socket failed: {rest}"
     
+    kind, _, rest = c1.friend_list()
     assert kind == "OK"
-    # stat_b should show offline
-    assert "offline" in rest.lower(), f"stat_b should be offline: {rest}"
+    assert "online" in rest.lower(), f"stat_b should show online again: {rest}"
     
     c1.close()
+    c2.close()
 
 
 # ============ FRIEND_DELETE Tests ============
@@ -367,11 +337,8 @@ def test_delete_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("del_a", "password123", "da@test.com")
-    c2.register("del_b", "password123", "db@test.com")
-    
-    c1.login("del_a", "password123")
-    c2.login("del_b", "password123")
+    c1.register_and_login("del_a", "password123", "da@test.com")
+    c2.register_and_login("del_b", "password123", "db@test.com")
     
     # Make friends
     c1.friend_invite("del_b")
@@ -397,8 +364,7 @@ def test_delete_nonfriend(port: int):
     """Unfriend non-friend - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("del_solo", "password123", "ds@test.com")
-    c.login("del_solo", "password123")
+    c.register_and_login("del_solo", "password123", "ds@test.com")
     
     kind, _, rest = c.friend_delete("nosuchfriend")
     
@@ -413,11 +379,8 @@ def test_delete_mutual(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("mut_a", "password123", "ma@test.com")
-    c2.register("mut_b", "password123", "mb@test.com")
-    
-    c1.login("mut_a", "password123")
-    c2.login("mut_b", "password123")
+    c1.register_and_login("mut_a", "password123", "ma@test.com")
+    c2.register_and_login("mut_b", "password123", "mb@test.com")
     
     # Make friends
     c1.friend_invite("mut_b")
@@ -478,20 +441,12 @@ def run_all(port: int):
 
 
 def main():
-    port = free_port()
-    
-    backup_data()
-    proc = start_server(port, timeout_s=3600)
-    
-    try:
+    with running_server(timeout_s=3600) as port:
         passed, failed = run_all(port)
         print(f"\n{'='*60}")
         print(f"Friend Tests: {passed} passed, {failed} failed")
         print(f"{'='*60}")
         return 0 if failed == 0 else 1
-    finally:
-        stop_server(proc)
-        restore_data()
 
 
 if __name__ == "__main__":
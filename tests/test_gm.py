@@ -26,14 +26,13 @@ Test Cases:
 20. Unicode content - UTF-8 in group messages
 """
 
+import re
 import sys
 import os
-import time
 
 sys.path.insert(0, os.path.dirname(__file__))
 from test_utils import (
-    Conn, free_port, start_server, stop_server,
-    backup_data, restore_data, parse_resp, parse_kv,
+    Conn, running_server, parse_resp, parse_kv,
     b64_encode, b64_decode,
     ok, die, info, section, TestRunner
 )
@@ -46,11 +45,8 @@ def test_send_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("gm_owner", "password123", "gmo@test.com")
-    c2.register("gm_member", "password123", "gmm@test.com")
-    
-    c1.login("gm_owner", "password123")
-    c2.login("gm_member", "password123")
+    c1.register_and_login("gm_owner", "password123", "gmo@test.com")
+    c2.register_and_login("gm_member", "password123", "gmm@test.com")
     
     _, _, _, group_id = c1.group_create("GMTestGroup")
     c1.group_add(group_id, "gm_member")
@@ -69,8 +65,7 @@ def test_send_nonexistent_group(port: int):
     """Send to non-existent group - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("gm_nogrp", "password123", "gmng@test.com")
-    c.login("gm_nogrp", "password123")
+    c.register_and_login("gm_nogrp", "password123", "gmng@test.com")
     
     kind, _, rest = c.gm_send(99999, "Hello?")
     
@@ -85,11 +80,8 @@ def test_send_nonmember(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("gm_own2", "password123", "gmo2@test.com")
-    c2.register("gm_outsider", "password123", "gmout@test.com")
-    
-    c1.login("gm_own2", "password123")
-    c2.login("gm_outsider", "password123")
+    c1.register_and_login("gm_own2", "password123", "gmo2@test.com")
+    c2.register_and_login("gm_outsider", "password123", "gmout@test.com")
     
     _, _, _, group_id = c1.group_create("PrivateGroup")
     
@@ -107,8 +99,7 @@ def test_send_invalid_token(port: int):
     """Send with invalid token - should fail with 401"""
     c = Conn(port=port)
     
-    c.register("gm_tok", "password123", "gmtok@test.com")
-    c.login("gm_tok", "password123")
+    c.register_and_login("gm_tok", "password123", "gmtok@test.com")
     _, _, _, group_id = c.group_create("TokenGroup")
     
     kind, _, rest = c.gm_send(group_id, "Hello", token="invalid_token_12345678901234")
@@ -123,8 +114,7 @@ def test_send_empty_content(port: int):
     """Send empty content - implementation may accept or reject"""
     c = Conn(port=port)
     
-    c.register("gm_empty", "password123", "gme@test.com")
-    c.login("gm_empty", "password123")
+    c.register_and_login("gm_empty", "password123", "gme@test.com")
     _, _, _, group_id = c.group_create("EmptyGroup")
     
     kind, _, rest = c.gm_send_raw(group_id, "")
@@ -142,11 +132,8 @@ def test_history_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("gmh_a", "password123", "gmha@test.com")
-    c2.register("gmh_b", "password123", "gmhb@test.com")
-    
-    c1.login("gmh_a", "password123")
-    c2.login("gmh_b", "password123")
+    c1.register_and_login("gmh_a", "password123", "gmha@test.com")
+    c2.register_and_login("gmh_b", "password123", "gmhb@test.com")
     
     _, _, _, group_id = c1.group_create("HistGroup")
     c1.group_add(group_id, "gmh_b")
@@ -170,8 +157,7 @@ def test_history_empty(port: int):
     """History is empty"""
     c = Conn(port=port)
     
-    c.register("gmhe", "password123", "gmhe@test.com")
-    c.login("gmhe", "password123")
+    c.register_and_login("gmhe", "password123", "gmhe@test.com")
     _, _, _, group_id = c.group_create("EmptyHistGroup")
     
     kind, _, rest = c.gm_history(group_id)
@@ -189,11 +175,8 @@ def test_history_nonmember(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("gmhn_own", "password123", "gmhno@test.com")
-    c2.register("gmhn_out", "password123", "gmhnout@test.com")
-    
-    c1.login("gmhn_own", "password123")
-    c2.login("gmhn_out", "password123")
+    c1.register_and_login("gmhn_own", "password123", "gmhno@test.com")
+    c2.register_and_login("gmhn_out", "password123", "gmhnout@test.com")
     
     _, _, _, group_id = c1.group_create("PrivHistGroup")
     c1.gm_send(group_id, "Secret message")
@@ -215,11 +198,8 @@ def test_chat_start_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("gmc_a", "password123", "gmca@test.com")
-    c2.register("gmc_b", "password123", "gmcb@test.com")
-    
-    c1.login("gmc_a", "password123")
-    c2.login("gmc_b", "password123")
+    c1.register_and_login("gmc_a", "password123", "gmca@test.com")
+    c2.register_and_login("gmc_b", "password123", "gmcb@test.com")
     
     _, _, _, group_id = c1.group_create("ChatGroup")
     c1.group_add(group_id, "gmc_b")
@@ -237,11 +217,8 @@ def test_chat_start_nonmember(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("gmcs_own", "password123", "gmcso@test.com")
-    c2.register("gmcs_out", "password123", "gmcsout@test.com")
-    
-    c1.login("gmcs_own", "password123")
-    c2.login("gmcs_out", "password123")
+    c1.register_and_login("gmcs_own", "password123", "gmcso@test.com")
+    c2.register_and_login("gmcs_out", "password123", "gmcsout@test.com")
     
     _, _, _, group_id = c1.group_create("NoJoinGroup")
     
@@ -258,8 +235,7 @@ def test_chat_end_success(port: int):
     """Exit group chat mode"""
     c = Conn(port=port)
     
-    c.register("gmce", "password123", "gmce@test.com")
-    c.login("gmce", "password123")
+    c.register_and_login("gmce", "password123", "gmce@test.com")
     _, _, _, group_id = c.group_create("EndGroup")
     
     c.gm_chat_start(group_id)
@@ -272,23 +248,23 @@ def test_chat_end_success(port: int):
 
 # ============ PUSH Tests ============
 
+# PUSH line formats come from server/handlers.c; "PUSH GM " (with the space)
+# is a chat message, not GM_JOIN/GM_LEAVE/GM_KICKED
+PUSH_GM = re.compile(r"^PUSH GM ")
+PUSH_GM_KICKED = re.compile(r"^PUSH GM_KICKED ")
+
 def test_push_all_members(port: int):
     """All members in chat receive PUSH GM"""
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     c3 = Conn(port=port)
     
-    c1.register("push_a", "password123", "pa@test.com")
-    c2.register("push_b", "password123", "pb@test.com")
-    c3.register("push_c", "password123", "pc@test.com")
-    
-    c1.login("push_a", "password123")
-    c2.login("push_b", "password123")
-    c3.login("push_c", "password123")
+    c1.register_and_login("push_a", "password123", "pa@test.com")
+    c2.register_and_login("push_b", "password123", "pb@test.com")
+    c3.register_and_login("push_c", "password123", "pc@test.com")
     
     _, _, _, group_id = c1.group_create("PushGroup")
-    c1.group_add(group_id, "push_b")
-    c1.group_add(group_id, "push_c")
+    c1.group_add_many(group_id, ["push_b", "push_c"])
     
     # All enter chat mode
     c1.gm_chat_start(group_id)
@@ -297,17 +273,12 @@ def test_push_all_members(port: int):
     
     # A sends message
     c1.gm_send(group_id, "Hello everyone!")
-    time.sleep(0.3)
     
     # B and C should receive PUSH GM
-    push_b = c2.drain_push(timeout=0.5)
-    push_c = c3.drain_push(timeout=0.5)
-    
-    found_b = any("PUSH GM" in msg and "push_a" in msg for msg in push_b)
-    found_c = any("PUSH GM" in msg and "push_a" in msg for msg in push_c)
+    from_a = re.compile(r"^PUSH GM from=push_a ")
     
-    assert found_b, f"B should receive PUSH GM: {push_b}"
-    assert found_c, f"C should receive PUSH GM: {push_c}"
+    assert c2.wait_for_push(from_a), f"B should receive PUSH GM: {c2.push_queue}"
+    assert c3.wait_for_push(from_a), f"C should receive PUSH GM: {c3.push_queue}"
     
     c1.close()
     c2.close()
@@ -320,17 +291,12 @@ def test_push_some_members(port: int):
     c2 = Conn(port=port)
     c3 = Conn(port=port)
     
-    c1.register("psome_a", "password123", "psa@test.com")
-    c2.register("psome_b", "password123", "psb@test.com")
-    c3.register("psome_c", "password123", "psc@test.com")
-    
-    c1.login("psome_a", "password123")
-    c2.login("psome_b", "password123")
-    c3.login("psome_c", "password123")
+    c1.register_and_login("psome_a", "password123", "psa@test.com")
+    c2.register_and_login("psome_b", "password123", "psb@test.com")
+    c3.register_and_login("psome_c", "password123", "psc@test.com")
     
     _, _, _, group_id = c1.group_create("PartialPushGroup")
-    c1.group_add(group_id, "psome_b")
-    c1.group_add(group_id, "psome_c")
+    c1.group_add_many(group_id, ["psome_b", "psome_c"])
     
     # Only A and B enter chat (C doesn't)
     c1.gm_chat_start(group_id)
@@ -339,14 +305,15 @@ def test_push_some_members(port: int):
     
     # A sends message
     c1.gm_send(group_id, "Partial push test")
-    time.sleep(0.3)
     
     # B should receive PUSH GM
-    push_b = c2.drain_push(timeout=0.5)
-    found_b = any("PUSH GM" in msg for msg in push_b)
-    assert found_b, f"B should receive PUSH GM: {push_b}"
+    found_b = c2.wait_for_push(PUSH_GM)
+    assert found_b, f"B should receive PUSH GM: {c2.push_queue}"
     
     # C should NOT receive PUSH (not in chat mode)
+    stray = c3.fence()
+    assert not any(PUSH_GM.search(m) for m in stray), f"C should not receive PUSH GM: {stray}"
+    
     # But message should be in history
     kind, _, rest = c3.gm_history(group_id)
     assert kind == "OK"
@@ -362,29 +329,22 @@ def test_push_join_notification(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("join_a", "password123", "ja@test.com")
-    c2.register("join_b", "password123", "jb@test.com")
-    
-    c1.login("join_a", "password123")
-    c2.login("join_b", "password123")
+    c1.register_and_login("join_a", "password123", "ja@test.com")
+    c2.register_and_login("join_b", "password123", "jb@test.com")
     
     _, _, _, group_id = c1.group_create("JoinNotifyGroup")
     c1.group_add(group_id, "join_b")
     
     # A enters chat first
     c1.gm_chat_start(group_id)
-    time.sleep(0.1)
-    c1.drain_push()  # Clear any initial messages
     
     # B enters chat
     c2.gm_chat_start(group_id)
-    time.sleep(0.3)
     
     # A should receive GM_JOIN notification
-    push_a = c1.drain_push(timeout=0.5)
-    found_join = any("PUSH GM_JOIN" in msg and "join_b" in msg for msg in push_a)
+    found_join = c1.wait_for_push(re.compile(r"^PUSH GM_JOIN user=join_b "))
     
-    assert found_join, f"A should receive GM_JOIN for join_b: {push_a}"
+    assert found_join, f"A should receive GM_JOIN for join_b: {c1.push_queue}"
     
     c1.close()
     c2.close()
@@ -395,11 +355,8 @@ def test_push_leave_notification(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("leave_a", "password123", "lea@test.com")
-    c2.register("leave_b", "password123", "leb@test.com")
-    
-    c1.login("leave_a", "password123")
-    c2.login("leave_b", "password123")
+    c1.register_and_login("leave_a", "password123", "lea@test.com")
+    c2.register_and_login("leave_b", "password123", "leb@test.com")
     
     _, _, _, group_id = c1.group_create("LeaveNotifyGroup")
     c1.group_add(group_id, "leave_b")
@@ -407,18 +364,14 @@ def test_push_leave_notification(port: int):
     # Both enter chat
     c1.gm_chat_start(group_id)
     c2.gm_chat_start(group_id)
-    time.sleep(0.2)
-    c1.drain_push()  # Clear join notifications
     
-    # B leaves chat
+    # B leaves chat (A's queued GM_JOIN for B does not match below)
     c2.gm_chat_end()
-    time.sleep(0.3)
     
     # A should receive GM_LEAVE notification
-    push_a = c1.drain_push(timeout=0.5)
-    found_leave = any("PUSH GM_LEAVE" in msg and "leave_b" in msg for msg in push_a)
+    found_leave = c1.wait_for_push(re.compile(r"^PUSH GM_LEAVE user=leave_b "))
     
-    assert found_leave, f"A should receive GM_LEAVE for leave_b: {push_a}"
+    assert found_leave, f"A should receive GM_LEAVE for leave_b: {c1.push_queue}"
     
     c1.close()
     c2.close()
@@ -429,29 +382,22 @@ def test_push_kicked_notification(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("kick_owner", "password123", "ko@test.com")
-    c2.register("kick_victim", "password123", "kv@test.com")
-    
-    c1.login("kick_owner", "password123")
-    c2.login("kick_victim", "password123")
+    c1.register_and_login("kick_owner", "password123", "ko@test.com")
+    c2.register_and_login("kick_victim", "password123", "kv@test.com")
     
     _, _, _, group_id = c1.group_create("KickGroup")
     c1.group_add(group_id, "kick_victim")
     
     # Victim enters chat
     c2.gm_chat_start(group_id)
-    time.sleep(0.1)
-    c2.drain_push()  # Clear any initial messages
     
     # Owner removes victim
     c1.group_remove(group_id, "kick_victim")
-    time.sleep(0.3)
     
     # Victim should receive GM_KICKED
-    push_victim = c2.drain_push(timeout=0.5)
-    found_kicked = any("PUSH GM_KICKED" in msg for msg in push_victim)
+    found_kicked = c2.wait_for_push(PUSH_GM_KICKED)
     
-    assert found_kicked, f"Victim should receive GM_KICKED: {push_victim}"
+    assert found_kicked, f"Victim should receive GM_KICKED: {c2.push_queue}"
     
     c1.close()
     c2.close()
@@ -464,11 +410,8 @@ def test_multiple_groups(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("mg_a", "password123", "mga@test.com")
-    c2.register("mg_b", "password123", "mgb@test.com")
-    
-    c1.login("mg_a", "password123")
-    c2.login("mg_b", "password123")
+    c1.register_and_login("mg_a", "password123", "mga@test.com")
+    c2.register_and_login("mg_b", "password123", "mgb@test.com")
     
     # Create 2 groups
     _, _, _, gid1 = c1.group_create("MultiGroup1")
@@ -483,13 +426,10 @@ def test_multiple_groups(port: int):
     # A sends to both groups
     c1.gm_send(gid1, "Message to group 1")
     c1.gm_send(gid2, "Message to group 2")
-    time.sleep(0.3)
     
     # B should only receive message from group 1 (the one they're chatting in)
-    push_b = c2.drain_push(timeout=0.5)
-    
-    found_g1 = any("PUSH GM" in msg and str(gid1) in msg for msg in push_b)
-    assert found_g1, f"B should receive message from group 1: {push_b}"
+    found_g1 = c2.wait_for_push(re.compile(rf"^PUSH GM .*\bgroup_id={gid1} "))
+    assert found_g1, f"B should receive message from group 1: {c2.push_queue}"
     
     # Group 2 message should be in history
     kind, _, rest = c2.gm_history(gid2)
@@ -505,34 +445,25 @@ def test_large_group(port: int):
     
     # Register and login all
     for i, c in enumerate(connections):
-        c.register(f"lg_user{i}", "password123", f"lg{i}@test.com")
-        c.login(f"lg_user{i}", "password123")
+        c.register_and_login(f"lg_user{i}", "password123", f"lg{i}@test.com")
     
     # First user creates group and adds others
     owner = connections[0]
     _, _, _, group_id = owner.group_create("LargeGroup")
     
-    for i in range(1, 5):
-        owner.group_add(group_id, f"lg_user{i}")
+    owner.group_add_many(group_id, [f"lg_user{i}" for i in range(1, 5)])
     
     # All enter chat
     for c in connections:
         c.gm_chat_start(group_id)
-    time.sleep(0.2)
-    
-    # Clear initial notifications
-    for c in connections:
-        c.drain_push()
     
     # Owner sends message
     owner.gm_send(group_id, "Hello large group!")
-    time.sleep(0.3)
     
-    # All others should receive
+    # All others should receive (GM_JOIN notifications stay queued)
     for i in range(1, 5):
-        push = connections[i].drain_push(timeout=0.5)
-        found = any("PUSH GM" in msg for msg in push)
-        assert found, f"User {i} should receive PUSH GM: {push}"
+        found = connections[i].wait_for_push(PUSH_GM)
+        assert found, f"User {i} should receive PUSH GM: {connections[i].push_queue}"
     
     for c in connections:
         c.close()
@@ -543,11 +474,8 @@ def test_unicode_gm(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("uni_gma", "password123", "ugma@test.com")
-    c2.register("uni_gmb", "password123", "ugmb@test.com")
-    
-    c1.login("uni_gma", "password123")
-    c2.login("uni_gmb", "password123")
+    c1.register_and_login("uni_gma", "password123", "ugma@test.com")
+    c2.register_and_login("uni_gmb", "password123", "ugmb@test.com")
     
     _, _, _, group_id = c1.group_create("UnicodeGMGroup")
     c1.group_add(group_id, "uni_gmb")
@@ -604,20 +532,12 @@ def run_all(port: int):
 
 
 def main():
-    port = free_port()
-    
-    backup_data()
-    proc = start_server(port, timeout_s=3600)
-    
-    try:
+    with running_server(timeout_s=3600) as port:
         passed, failed = run_all(port)
         print(f"\n{'='*60}")
         print(f"GM Tests: {passed} passed, {failed} failed")
         print(f"{'='*60}")
         return 0 if failed == 0 else 1
-    finally:
-        stop_server(proc)
-        restore_data()
 
 
 if __name__ == "__main__":
@@ -31,8 +31,7 @@ import time
 
 sys.path.insert(0, os.path.dirname(__file__))
 from test_utils import (
-    Conn, free_port, start_server, stop_server,
-    backup_data, restore_data, parse_resp, parse_kv,
+    Conn, running_server, parse_resp, parse_kv,
     ok, die, info, section, TestRunner
 )
 
@@ -43,8 +42,7 @@ def test_create_success(port: int):
     """Create group successfully"""
     c = Conn(port=port)
     
-    c.register("grp_owner", "password123", "grp@test.com")
-    c.login("grp_owner", "password123")
+    c.register_and_login("grp_owner", "password123", "grp@test.com")
     
     kind, _, rest, group_id = c.group_create("MyTestGroup")
     
@@ -58,8 +56,7 @@ def test_create_invalid_name_empty(port: int):
     """Create group with empty name - should fail"""
     c = Conn(port=port)
     
-    c.register("grp_empty", "password123", "ge@test.com")
-    c.login("grp_empty", "password123")
+    c.register_and_login("grp_empty", "password123", "ge@test.com")
     
     # Send raw to test empty name
     rid = c.next_id()
@@ -91,11 +88,8 @@ def test_add_member_success(port: int):
     c1 = Conn(port=port)  # Owner
     c2 = Conn(port=port)  # New member
     
-    c1.register("add_owner", "password123", "ao@test.com")
-    c2.register("add_member", "password123", "am@test.com")
-    
-    c1.login("add_owner", "password123")
-    c2.login("add_member", "password123")
+    c1.register_and_login("add_owner", "password123", "ao@test.com")
+    c2.register_and_login("add_member", "password123", "am@test.com")
     
     # Create group
     _, _, _, group_id = c1.group_create("AddTestGroup")
@@ -118,14 +112,10 @@ def test_add_nonowner_forbidden(port: int):
     """Non-owner cannot add members - should fail with 403"""
     c1 = Conn(port=port)  # Owner
     c2 = Conn(port=port)  # Member
-    c3 = Conn(port=port)  # Target
-    
-    c1.register("no_owner", "password123", "no@test.com")
-    c2.register("no_member", "password123", "nm@test.com")
-    c3.register("no_target", "password123", "nt@test.com")
     
-    c1.login("no_owner", "password123")
-    c2.login("no_member", "password123")
+    c1.register_and_login("no_owner", "password123", "no@test.com")
+    c2.register_and_login("no_member", "password123", "nm@test.com")
+    c1.register("no_target", "password123", "nt@test.com")
     
     # Owner creates group and adds member
     _, _, _, group_id = c1.group_create("NoAddGroup")
@@ -139,15 +129,13 @@ def test_add_nonowner_forbidden(port: int):
     
     c1.close()
     c2.close()
-    c3.close()
 
 
 def test_add_nonexistent_user(port: int):
     """Add non-existent user - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("add_nouser", "password123", "anu@test.com")
-    c.login("add_nouser", "password123")
+    c.register_and_login("add_nouser", "password123", "anu@test.com")
     
     _, _, _, group_id = c.group_create("NoUserGroup")
     
@@ -164,11 +152,8 @@ def test_add_already_member(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("dup_owner", "password123", "do@test.com")
-    c2.register("dup_member", "password123", "dm@test.com")
-    
-    c1.login("dup_owner", "password123")
-    c2.login("dup_member", "password123")
+    c1.register_and_login("dup_owner", "password123", "do@test.com")
+    c2.register_and_login("dup_member", "password123", "dm@test.com")
     
     _, _, _, group_id = c1.group_create("DupMemberGroup")
     c1.group_add(group_id, "dup_member")
@@ -186,12 +171,9 @@ def test_add_already_member(port: int):
 def test_add_nonexistent_group(port: int):
     """Add to non-existent group - should fail with 404 or 403"""
     c1 = Conn(port=port)
-    c2 = Conn(port=port)
-    
-    c1.register("nog_owner", "password123", "nogo@test.com")
-    c2.register("nog_member", "password123", "nogm@test.com")
     
-    c1.login("nog_owner", "password123")
+    c1.register_and_login("nog_owner", "password123", "nogo@test.com")
+    c1.register("nog_member", "password123", "nogm@test.com")
     
     kind, _, rest = c1.group_add(99999, "nog_member")
     
@@ -200,7 +182,6 @@ def test_add_nonexistent_group(port: int):
     assert "404" in rest or "403" in rest, f"Expected 404/403 error, got {rest}"
     
     c1.close()
-    c2.close()
 
 
 # ============ GROUP_REMOVE Tests ============
@@ -210,11 +191,8 @@ def test_remove_member_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("rem_owner", "password123", "ro@test.com")
-    c2.register("rem_member", "password123", "rm@test.com")
-    
-    c1.login("rem_owner", "password123")
-    c2.login("rem_member", "password123")
+    c1.register_and_login("rem_owner", "password123", "ro@test.com")
+    c2.register_and_login("rem_member", "password123", "rm@test.com")
     
     _, _, _, group_id = c1.group_create("RemoveGroup")
     c1.group_add(group_id, "rem_member")
@@ -238,17 +216,12 @@ def test_remove_nonowner_forbidden(port: int):
     c2 = Conn(port=port)
     c3 = Conn(port=port)
     
-    c1.register("noremo_owner", "password123", "nro@test.com")
-    c2.register("noremo_m1", "password123", "nrm1@test.com")
-    c3.register("noremo_m2", "password123", "nrm2@test.com")
-    
-    c1.login("noremo_owner", "password123")
-    c2.login("noremo_m1", "password123")
-    c3.login("noremo_m2", "password123")
+    c1.register_and_login("noremo_owner", "password123", "nro@test.com")
+    c2.register_and_login("noremo_m1", "password123", "nrm1@test.com")
+    c3.register_and_login("noremo_m2", "password123", "nrm2@test.com")
     
     _, _, _, group_id = c1.group_create("NoRemoveGroup")
-    c1.group_add(group_id, "noremo_m1")
-    c1.group_add(group_id, "noremo_m2")
+    c1.group_add_many(group_id, ["noremo_m1", "noremo_m2"])
     
     # m1 tries to remove m2
     kind, _, rest = c2.group_remove(group_id, "noremo_m2")
@@ -265,8 +238,7 @@ def test_remove_self_owner(port: int):
     """Owner trying to remove self - behavior varies by implementation"""
     c = Conn(port=port)
     
-    c.register("selfrem_owner", "password123", "sro@test.com")
-    c.login("selfrem_owner", "password123")
+    c.register_and_login("selfrem_owner", "password123", "sro@test.com")
     
     _, _, _, group_id = c.group_create("SelfRemoveGroup")
     
@@ -283,8 +255,7 @@ def test_remove_nonmember(port: int):
     """Remove non-member - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("rem_noone", "password123", "rno@test.com")
-    c.login("rem_noone", "password123")
+    c.register_and_login("rem_noone", "password123", "rno@test.com")
     
     _, _, _, group_id = c.group_create("RemNooneGroup")
     
@@ -303,11 +274,8 @@ def test_leave_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("leave_owner", "password123", "lo@test.com")
-    c2.register("leave_member", "password123", "lm@test.com")
-    
-    c1.login("leave_owner", "password123")
-    c2.login("leave_member", "password123")
+    c1.register_and_login("leave_owner", "password123", "lo@test.com")
+    c2.register_and_login("leave_member", "password123", "lm@test.com")
     
     _, _, _, group_id = c1.group_create("LeaveGroup")
     c1.group_add(group_id, "leave_member")
@@ -329,8 +297,7 @@ def test_leave_owner_forbidden(port: int):
     """Owner cannot leave group - should fail"""
     c = Conn(port=port)
     
-    c.register("leave_own", "password123", "lon@test.com")
-    c.login("leave_own", "password123")
+    c.register_and_login("leave_own", "password123", "lon@test.com")
     
     _, _, _, group_id = c.group_create("OwnerLeaveGroup")
     
@@ -348,11 +315,8 @@ def test_leave_not_member(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("leave_out_own", "password123", "loo@test.com")
-    c2.register("leave_out_m", "password123", "lom@test.com")
-    
-    c1.login("leave_out_own", "password123")
-    c2.login("leave_out_m", "password123")
+    c1.register_and_login("leave_out_own", "password123", "loo@test.com")
+    c2.register_and_login("leave_out_m", "password123", "lom@test.com")
     
     _, _, _, group_id = c1.group_create("NotMemberGroup")
     
@@ -372,8 +336,7 @@ def test_list_groups(port: int):
     """List groups user is member of"""
     c = Conn(port=port)
     
-    c.register("list_user", "password123", "lu@test.com")
-    c.login("list_user", "password123")
+    c.register_and_login("list_user", "password123", "lu@test.com")
     
     # Create 2 groups
     _, _, _, gid1 = c.group_create("ListGroup1")
@@ -392,8 +355,7 @@ def test_list_empty(port: int):
     """Group list is empty"""
     c = Conn(port=port)
     
-    c.register("nogroups", "password123", "ng@test.com")
-    c.login("nogroups", "password123")
+    c.register_and_login("nogroups", "password123", "ng@test.com")
     
     kind, _, rest = c.group_list()
     
@@ -412,11 +374,8 @@ def test_members_list(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("mem_owner", "password123", "mo@test.com")
-    c2.register("mem_user", "password123", "mu@test.com")
-    
-    c1.login("mem_owner", "password123")
-    c2.login("mem_user", "password123")
+    c1.register_and_login("mem_owner", "password123", "mo@test.com")
+    c2.register_and_login("mem_user", "password123", "mu@test.com")
     
     _, _, _, group_id = c1.group_create("MembersGroup")
     c1.group_add(group_id, "mem_user")
@@ -436,11 +395,8 @@ def test_members_nonmember_forbidden(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("priv_owner", "password123", "po@test.com")
-    c2.register("priv_outsider", "password123", "pou@test.com")
-    
-    c1.login("priv_owner", "password123")
-    c2.login("priv_outsider", "password123")
+    c1.register_and_login("priv_owner", "password123", "po@test.com")
+    c2.register_and_login("priv_outsider", "password123", "pou@test.com")
     
     _, _, _, group_id = c1.group_create("PrivateGroup")
     
@@ -495,20 +451,12 @@ def run_all(port: int):
 
 
 def main():
-    port = free_port()
-    
-    backup_data()
-    proc = start_server(port, timeout_s=3600)
-    
-    try:
+    with running_server(timeout_s=3600) as port:
         passed, failed = run_all(port)
         print(f"\n{'='*60}")
         print(f"Group Tests: {passed} passed, {failed} failed")
         print(f"{'='*60}")
         return 0 if failed == 0 else 1
-    finally:
-        stop_server(proc)
-        restore_data()
 
 
 if __name__ == "__main__":
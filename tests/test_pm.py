@@ -28,13 +28,12 @@ Test Cases:
 
 import sys
 import os
-import time
+import re
 import threading
 
 sys.path.insert(0, os.path.dirname(__file__))
 from test_utils import (
-    Conn, free_port, start_server, stop_server,
-    backup_data, restore_data, parse_resp, parse_kv,
+    Conn, running_server, parse_resp, parse_kv,
     b64_encode, b64_decode,
     ok, die, info, section, TestRunner
 )
@@ -47,11 +46,8 @@ def test_send_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("pm_sender", "password123", "pms@test.com")
-    c2.register("pm_receiver", "password123", "pmr@test.com")
-    
-    c1.login("pm_sender", "password123")
-    c2.login("pm_receiver", "password123")
+    c1.register_and_login("pm_sender", "password123", "pms@test.com")
+    c2.register_and_login("pm_receiver", "password123", "pmr@test.com")
     
     kind, _, rest = c1.pm_send("pm_receiver", "Hello!")
     
@@ -68,11 +64,8 @@ def test_send_content_stored(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("store_s", "password123", "ss@test.com")
-    c2.register("store_r", "password123", "sr@test.com")
-    
-    c1.login("store_s", "password123")
-    c2.login("store_r", "password123")
+    c1.register_and_login("store_s", "password123", "ss@test.com")
+    c2.register_and_login("store_r", "password123", "sr@test.com")
     
     original_msg = "Test message with special chars: !@#$%"
     c1.pm_send("store_r", original_msg)
@@ -92,8 +85,7 @@ def test_send_nonexistent_user(port: int):
     """Send to non-existent user - should fail with 404"""
     c = Conn(port=port)
     
-    c.register("send_alone", "password123", "sa@test.com")
-    c.login("send_alone", "password123")
+    c.register_and_login("send_alone", "password123", "sa@test.com")
     
     kind, _, rest = c.pm_send("nosuchuser", "Hello?")
     
@@ -120,12 +112,9 @@ def test_send_invalid_token(port: int):
 def test_send_empty_content(port: int):
     """Send empty content - behavior varies by implementation"""
     c1 = Conn(port=port)
-    c2 = Conn(port=port)
-    
-    c1.register("empty_s", "password123", "es@test.com")
-    c2.register("empty_r", "password123", "er@test.com")
     
-    c1.login("empty_s", "password123")
+    c1.register_and_login("empty_s", "password123", "es@test.com")
+    c1.register("empty_r", "password123", "er@test.com")
     
     # Send raw with empty content
     kind, _, rest = c1.pm_send_raw("empty_r", "")
@@ -135,7 +124,6 @@ def test_send_empty_content(port: int):
     assert kind in ["OK", "ERR"], f"Unexpected response: {kind}"
     
     c1.close()
-    c2.close()
 
 
 # ============ PM_HISTORY Tests ============
@@ -145,11 +133,8 @@ def test_history_success(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("hist_a", "password123", "ha@test.com")
-    c2.register("hist_b", "password123", "hb@test.com")
-    
-    c1.login("hist_a", "password123")
-    c2.login("hist_b", "password123")
+    c1.register_and_login("hist_a", "password123", "ha@test.com")
+    c2.register_and_login("hist_b", "password123", "hb@test.com")
     
     # Send multiple messages
     c1.pm_send("hist_b", "Message 1")
@@ -170,12 +155,9 @@ def test_history_success(port: int):
 def test_history_empty(port: int):
     """History is empty"""
     c1 = Conn(port=port)
-    c2 = Conn(port=port)
     
-    c1.register("emp_a", "password123", "ea@test.com")
-    c2.register("emp_b", "password123", "eb@test.com")
-    
-    c1.login("emp_a", "password123")
+    c1.register_and_login("emp_a", "password123", "ea@test.com")
+    c1.register("emp_b", "password123", "eb@test.com")
     
     kind, _, rest = c1.pm_history("emp_b")
     
@@ -185,7 +167,6 @@ def test_history_empty(port: int):
     assert messages == "" or messages == "empty", f"Should be empty: {rest}"
     
     c1.close()
-    c2.close()
 
 
 def test_history_with_limit(port: int):
@@ -193,21 +174,22 @@ def test_history_with_limit(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("lim_a", "password123", "la@test.com")
-    c2.register("lim_b", "password123", "lb@test.com")
-    
-    c1.login("lim_a", "password123")
-    c2.login("lim_b", "password123")
+    c1.register_and_login("lim_a", "password123", "la@test.com")
+    c2.register_and_login("lim_b", "password123", "lb@test.com")
     
     # Send 5 messages
-    for i in range(5):
-        c1.pm_send("lim_b", f"Message {i}")
+    results = c1.pm_send_many("lim_b", [f"Message {i}" for i in range(5)])
+    assert all(kind == "OK" for kind, _, _ in results), f"Sends failed: {results}"
     
     # Get history with limit=2
     kind, _, rest = c1.pm_history("lim_b", limit=2)
     
     assert kind == "OK", f"Expected OK: {rest}"
-    # Should only have 2 messages (implementation dependent)
+    # Entries are comma-separated and Base64 content has no commas,
+    # so counting separators avoids splitting the payload into a list
+    messages = parse_kv(rest).get("messages", "")
+    msg_count = messages.count(",") + 1 if messages and messages != "empty" else 0
+    assert msg_count == 2, f"Expected 2 messages with limit=2, got {msg_count}: {rest}"
     
     c1.close()
     c2.close()
@@ -221,13 +203,9 @@ def test_conversations_list(port: int):
     c2 = Conn(port=port)
     c3 = Conn(port=port)
     
-    c1.register("conv_a", "password123", "ca@test.com")
-    c2.register("conv_b", "password123", "cb@test.com")
-    c3.register("conv_c", "password123", "cc@test.com")
-    
-    c1.login("conv_a", "password123")
-    c2.login("conv_b", "password123")
-    c3.login("conv_c", "password123")
+    c1.register_and_login("conv_a", "password123", "ca@test.com")
+    c2.register_and_login("conv_b", "password123", "cb@test.com")
+    c3.register_and_login("conv_c", "password123", "cc@test.com")
     
     # A chats with B and C
     c1.pm_send("conv_b", "Hi B")
@@ -248,8 +226,7 @@ def test_conversations_empty(port: int):
     """No conversations"""
     c = Conn(port=port)
     
-    c.register("noconv", "password123", "nc@test.com")
-    c.login("noconv", "password123")
+    c.register_and_login("noconv", "password123", "nc@test.com")
     
     kind, _, rest = c.pm_conversations()
     
@@ -266,30 +243,23 @@ def test_conversations_empty(port: int):
 def test_chat_start_success(port: int):
     """Enter chat mode"""
     c1 = Conn(port=port)
-    c2 = Conn(port=port)
-    
-    c1.register("chat_a", "password123", "cha@test.com")
-    c2.register("chat_b", "password123", "chb@test.com")
     
-    c1.login("chat_a", "password123")
+    c1.register_and_login("chat_a", "password123", "cha@test.com")
+    c1.register("chat_b", "password123", "chb@test.com")
     
     kind, _, rest = c1.pm_chat_start("chat_b")
     
     assert kind == "OK", f"Expected OK: {rest}"
     
     c1.close()
-    c2.close()
 
 
 def test_chat_end_success(port: int):
     """Exit chat mode"""
     c1 = Conn(port=port)
-    c2 = Conn(port=port)
-    
-    c1.register("end_a", "password123", "enda@test.com")
-    c2.register("end_b", "password123", "endb@test.com")
     
-    c1.login("end_a", "password123")
+    c1.register_and_login("end_a", "password123", "enda@test.com")
+    c1.register("end_b", "password123", "endb@test.com")
     
     c1.pm_chat_start("end_b")
     kind, _, rest = c1.pm_chat_end()
@@ -297,21 +267,20 @@ def test_chat_end_success(port: int):
     assert kind == "OK", f"Expected OK: {rest}"
     
     c1.close()
-    c2.close()
 
 
 # ============ Real-time PUSH Tests ============
 
+# One anchored pattern per expected sender, so each queued line is scanned once
+PUSH_PM_FROM = "^PUSH PM from={} "
+
 def test_realtime_both_in_chat(port: int):
     """Both users in chat mode - instant PUSH"""
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("rt_a", "password123", "rta@test.com")
-    c2.register("rt_b", "password123", "rtb@test.com")
-    
-    c1.login("rt_a", "password123")
-    c2.login("rt_b", "password123")
+    c1.register_and_login("rt_a", "password123", "rta@test.com")
+    c2.register_and_login("rt_b", "password123", "rtb@test.com")
     
     # Both enter chat mode with each other
     c1.pm_chat_start("rt_b")
@@ -321,13 +290,9 @@ def test_realtime_both_in_chat(port: int):
     kind, _, _ = c1.pm_send("rt_b", "Real-time test")
     assert kind == "OK"
     
-    # B should receive PUSH
-    time.sleep(0.2)
-    push_msgs = c2.drain_push(timeout=0.5)
-    
-    # Should have received PUSH PM
-    found_push = any("PUSH PM" in msg for msg in push_msgs)
-    assert found_push, f"Should receive PUSH PM, got: {push_msgs}"
+    # B should receive PUSH PM
+    found_push = c2.wait_for_push(re.compile(PUSH_PM_FROM.format("rt_a")))
+    assert found_push, f"Should receive PUSH PM, got: {c2.push_queue}"
     
     c1.close()
     c2.close()
@@ -338,11 +303,8 @@ def test_realtime_only_receiver(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("orec_a", "password123", "oa@test.com")
-    c2.register("orec_b", "password123", "ob@test.com")
-    
-    c1.login("orec_a", "password123")
-    c2.login("orec_b", "password123")
+    c1.register_and_login("orec_a", "password123", "oa@test.com")
+    c2.register_and_login("orec_b", "password123", "ob@test.com")
     
     # Only B in chat mode
     c2.pm_chat_start("orec_a")
@@ -351,11 +313,8 @@ def test_realtime_only_receiver(port: int):
     c1.pm_send("orec_b", "From outside chat")
     
     # B should still receive PUSH
-    time.sleep(0.2)
-    push_msgs = c2.drain_push(timeout=0.5)
-    
-    found_push = any("PUSH PM" in msg for msg in push_msgs)
-    assert found_push, f"Should receive PUSH PM even if sender not in chat: {push_msgs}"
+    found_push = c2.wait_for_push(re.compile(PUSH_PM_FROM.format("orec_a")))
+    assert found_push, f"Should receive PUSH PM even if sender not in chat: {c2.push_queue}"
     
     c1.close()
     c2.close()
@@ -366,10 +325,8 @@ def test_offline_message(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("off_a", "password123", "offa@test.com")
+    c1.register_and_login("off_a", "password123", "offa@test.com")
     c2.register("off_b", "password123", "offb@test.com")
-    
-    c1.login("off_a", "password123")
     # B is offline
     
     # A sends message
@@ -395,11 +352,8 @@ def test_unicode_content(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("uni_a", "password123", "ua@test.com")
-    c2.register("uni_b", "password123", "ub@test.com")
-    
-    c1.login("uni_a", "password123")
-    c2.login("uni_b", "password123")
+    c1.register_and_login("uni_a", "password123", "ua@test.com")
+    c2.register_and_login("uni_b", "password123", "ub@test.com")
     
     # Send message with Unicode
     unicode_msg = "Hello 世界! 🎉 Привет мир!"
@@ -420,11 +374,8 @@ def test_long_message(port: int):
     c1 = Conn(port=port)
     c2 = Conn(port=port)
     
-    c1.register("long_a", "password123", "longa@test.com")
-    c2.register("long_b", "password123", "longb@test.com")
-    
-    c1.login("long_a", "password123")
-    c2.login("long_b", "password123")
+    c1.register_and_login("long_a", "password123", "longa@test.com")
+    c2.register_and_login("long_b", "password123", "longb@test.com")
     
     # Send long message (1000 chars)
     long_msg = "A" * 1000
@@ -442,13 +393,9 @@ def test_multiple_conversations(port: int):
     c2 = Conn(port=port)
     c3 = Conn(port=port)
     
-    c1.register("multi_a", "password123", "ma@test.com")
-    c2.register("multi_b", "password123", "mb@test.com")
-    c3.register("multi_c", "password123", "mc@test.com")
-    
-    c1.login("multi_a", "password123")
-    c2.login("multi_b", "password123")
-    c3.login("multi_c", "password123")
+    c1.register_and_login("multi_a", "password123", "ma@test.com")
+    c2.register_and_login("multi_b", "password123", "mb@test.com")
+    c3.register_and_login("multi_c", "password123", "mc@test.com")
     
     # A chats with B
     c1.pm_send("multi_b", "Hi B!")
@@ -517,20 +464,12 @@ def run_all(port: int):
 
 
 def main():
-    port = free_port()
-    
-    backup_data()
-    proc = start_server(port, timeout_s=3600)
-    
-    try:
+    with running_server(timeout_s=3600) as port:
         passed, failed = run_all(port)
         print(f"\n{'='*60}")
         print(f"PM Tests: {passed} passed, {failed} failed")
         print(f"{'='*60}")
         return 0 if failed == 0 else 1
-    finally:
-        stop_server(proc)
-        restore_data()
 
 
 if __name__ == "__main__":
@@ -2,20 +2,31 @@
 """
 Test utilities and helpers for ChatProject integration tests.
 Provides common functions, Conn class, server management.
+
+All tests of a suite/session share one server and one data dir, with no
+reset in between and tests running concurrently. run_all_tests.py starts one
+per suite process and the pytest `port` fixture one per xdist worker. Every test must therefore use its
+own usernames and group names, and must not assume empty tables (use the
+group id returned by GROUP_CREATE; 99999 is used as a never-created id).
 """
 
 import base64
 import os
+import re
 import select
+import shutil
 import socket
 import subprocess
 import sys
+import tempfile
+import threading
 import time
-from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-SERVER_BIN = os.path.join(PROJECT_ROOT, "build", "server")
-DATA_DIR = os.path.join(PROJECT_ROOT, "data")
+# Test build of the server (make builds it with -DITEST, enabling DEBUG_EXPIRE)
+SERVER_BIN = os.path.join(PROJECT_ROOT, "build", "server_itest")
 
 
 # ============ Output Helpers ============
@@ -73,14 +84,13 @@ def parse_resp(line: str) -> tuple:
     return (kind, rid, rest)
 
 
+# key=value token: key up to the first "=", value up to the next whitespace (may be empty)
+_KV_RE = re.compile(r"([^\s=]+)=(\S*)")
+
+
 def parse_kv(payload: str) -> dict:
     """Parse key=value pairs from payload"""
-    kv = {}
-    for token in payload.split():
-        if "=" in token:
-            k, v = token.split("=", 1)
-            kv[k] = v
-    return kv
+    return dict(_KV_RE.findall(payload))
 
 
 def b64_encode(text: str) -> str:
@@ -98,11 +108,25 @@ def b64_decode(b64: str) -> str:
 
 # ============ Network Helpers ============
 
-def free_port() -> int:
-    """Get a free port"""
-    with closing(socket.socket(socket.AF_INET, socket.SOCK_STREAM)) as s:
-        s.bind(("127.0.0.1", 0))
-        return s.getsockname()[1]
+def wait_for(predicate, timeout: float = 1.0, interval: float = 0.005):
+    """
+    Poll `predicate` until it returns a truthy value or `timeout` elapses.
+    Returns the last result, so callers can assert on it (falsy = timed out).
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        result = predicate()
+        if result or time.monotonic() >= deadline:
+            return result
+        time.sleep(interval)
+
+
+# Client-side sanity cap on a single reply/PUSH line. Server replies are at most
+# ~8.5 KB (history payloads), so a line this long means a broken stream.
+MAX_LINE = 64 * 1024
+
+# Per-thread list of Conns opened by the running test (see TestRunner._run_one)
+_test_conns = threading.local()
 
 
 class Conn:
@@ -111,35 +135,59 @@ class Conn:
     Provides high-level methods for all protocol commands.
     """
     
-    def __init__(self, host: str = "127.0.0.1", port: int = 8888):
+    def __init__(self, host: str = "127.0.0.1", *, port: int):
         self.sock = socket.create_connection((host, port), timeout=5)
-        self.buf = b""
+        # Tests send many tiny writes (single bytes, one short command at a
+        # time); without this Nagle holds each one until the previous is ACKed
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Growable receive buffer + reusable scratch for recv_into():
+        # appending to a bytearray is amortized O(1), unlike bytes +=
+        self.buf = bytearray()
+        self._scan = 0  # buf offset where the next CRLF search starts
+        self._chunk = memoryview(bytearray(65536))
         self.req_id = 0
         self.push_queue = []  # Queue for PUSH messages
         self.token = ""  # Store token for convenience
+        tracked = getattr(_test_conns, "conns", None)
+        if tracked is not None:
+            tracked.append(self)
 
-    def send_line(self, line: str):
-        """Send a line (auto-appends \\r\\n)"""
-        self.sock.sendall((line + "\r\n").encode())
+    def send_line(self, line: str | bytes):
+        """Send a line (auto-appends \\r\\n); bytes are sent without re-encoding"""
+        if isinstance(line, str):
+            line = line.encode()
+        self.sock.sendall(line + b"\r\n")
 
     def send_bytes(self, data: bytes):
         """Send raw bytes"""
         self.sock.sendall(data)
 
+    def pipeline(self, lines: list) -> list:
+        """
+        Send several request lines in one sendall, then read one response per line.
+        The server answers in order, so N round trips collapse into one.
+        """
+        self.sock.sendall("".join(line + "\r\n" for line in lines).encode())
+        return [self.recv_line() for _ in lines]
+
     def recv_line(self, timeout: float = 3.0, skip_push: bool = True) -> str:
         """
         Receive next line.
         If skip_push=True, PUSH messages are queued and skipped.
         """
-        self.sock.settimeout(timeout)
+        # settimeout() costs an ioctl every call, even with an unchanged value
+        if self.sock.gettimeout() != timeout:
+            self.sock.settimeout(timeout)
         while True:
-            while b"\r\n" not in self.buf:
-                d = self.sock.recv(4096)
-                if not d:
+            line_str = self._pop_line()
+            if line_str is None:
+                if len(self.buf) > MAX_LINE:
+                    raise ValueError(f"no \\r\\n within {MAX_LINE} bytes")
+                n = self.sock.recv_into(self._chunk)
+                if not n:
                     raise EOFError("disconnected")
-                self.buf += d
-            line, self.buf = self.buf.split(b"\r\n", 1)
-            line_str = line.decode()
+                self.buf += self._chunk[:n]
+                continue
             
             # If this is a PUSH and we're skipping, queue it and continue
             if skip_push and line_str.startswith("PUSH "):
@@ -148,6 +196,19 @@ class Conn:
             
             return line_str
 
+    def _pop_line(self) -> str | None:
+        """Pop the next complete line from the buffer, or None if there is none yet"""
+        idx = self.buf.find(b"\r\n", self._scan)
+        if idx < 0:
+            # Only bytes appended later (plus a possible trailing \r) can hold the
+            # terminator; rescanning from 0 is quadratic for fragmented lines
+            self._scan = max(len(self.buf) - 1, 0)
+            return None
+        line = self.buf[:idx].decode()
+        del self.buf[:idx + 2]
+        self._scan = 0
+        return line
+
     def try_recv_line(self, timeout: float = 0.5) -> str | None:
         """
         Try to receive a line, return None if timeout.
@@ -163,17 +224,81 @@ class Conn:
             return None
 
     def drain_push(self, timeout: float = 0.3) -> list:
-        """Drain all PUSH messages from queue and socket"""
+        """
+        Drain all PUSH messages from queue and socket.
+        timeout=0 only takes what has already arrived. The socket's previous
+        timeout is restored afterwards, so later sends never run non-blocking.
+        To prove nothing is pending, use fence() instead.
+        """
         msgs = list(self.push_queue)
         self.push_queue.clear()
-        while True:
-            line = self.try_recv_line(timeout)
-            if line is None:
-                break
-            if line.startswith("PUSH "):
-                msgs.append(line)
+        prev_timeout = self.sock.gettimeout()
+        try:
+            while True:
+                line = self.try_recv_line(timeout)
+                if line is None:
+                    break
+                if line.startswith("PUSH "):
+                    msgs.append(line)
+        finally:
+            self.sock.settimeout(prev_timeout)
         return msgs
 
+    def fence(self) -> list:
+        """
+        Round-trip a PING and return the PUSH lines that arrived before its reply.
+        The server writes pushes synchronously, so once an earlier command on any
+        connection has been answered, its pushes to this socket precede the pong.
+        """
+        self.ping()
+        msgs = list(self.push_queue)
+        self.push_queue.clear()
+        return msgs
+
+    def wait_for_push(self, predicate, timeout: float = 1.0) -> str | None:
+        """
+        Wait until a PUSH line matching `predicate` arrives and return it (None on timeout).
+        `predicate` is a callable or a compiled regex (matched with .search).
+        Non-matching PUSH lines stay queued in push_queue; non-PUSH lines (replies
+        still in flight) are put back at the front of the receive buffer, in
+        order, so the next recv_line() still gets them. Returns as soon as the
+        line is read, unlike drain_push(), which always waits out its timeout.
+        """
+        if isinstance(predicate, re.Pattern):
+            predicate = predicate.search
+        for i, line in enumerate(self.push_queue):
+            if predicate(line):
+                return self.push_queue.pop(i)
+        
+        held = []  # replies read past while scanning for the push
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                line = self._pop_line()
+                if line is not None:
+                    if not line.startswith("PUSH "):
+                        held.append(line)
+                    elif predicate(line):
+                        return line
+                    else:
+                        self.push_queue.append(line)
+                    continue
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                readable, _, _ = select.select([self.sock], [], [], remaining)
+                if not readable:
+                    return None
+                n = self.sock.recv_into(self._chunk)
+                if not n:
+                    return None
+                self.buf += self._chunk[:n]
+        finally:
+            if held:
+                self.buf[:0] = b"".join(l.encode() + b"\r\n" for l in held)
+                self._scan = 0
+
     def next_id(self) -> str:
         """Get next request ID"""
         self.req_id += 1
@@ -212,6 +337,19 @@ class Conn:
         self.token = kv.get("token", "")
         return (kind, rid, rest, self.token)
 
+    def register_and_login(self, username: str, password: str, email: str) -> tuple:
+        """REGISTER + LOGIN pipelined in one round trip -> same result as login()"""
+        reg_id = self.next_id()
+        login_id = self.next_id()
+        _, resp = self.pipeline([
+            f"REGISTER {reg_id} username={username} password={password} email={email}",
+            f"LOGIN {login_id} username={username} password={password}",
+        ])
+        kind, rid, rest = parse_resp(resp)
+        kv = parse_kv(rest)
+        self.token = kv.get("token", "")
+        return (kind, rid, rest, self.token)
+
     def logout(self, token: str = None) -> tuple:
         """LOGOUT -> OK"""
         rid = self.next_id()
@@ -230,6 +368,13 @@ class Conn:
         resp = self.recv_line()
         return parse_resp(resp)
 
+    def debug_expire(self, token: str = None) -> tuple:
+        """DEBUG_EXPIRE (test build only) -> OK expired=1"""
+        rid = self.next_id()
+        t = token or self.token
+        self.send_line(f"DEBUG_EXPIRE {rid} token={t}")
+        return parse_resp(self.recv_line())
+
     def disconnect(self, token: str = None) -> tuple:
         """DISCONNECT -> OK (server closes connection)"""
         rid = self.next_id()
@@ -305,6 +450,13 @@ class Conn:
         self.send_line(f"GROUP_ADD {rid} token={t} group_id={group_id} username={username}")
         return parse_resp(self.recv_line())
 
+    def group_add_many(self, group_id: int, usernames: list, token: str = None) -> list:
+        """GROUP_ADD for several users pipelined in one round trip -> one result per user"""
+        t = token or self.token
+        lines = [f"GROUP_ADD {self.next_id()} token={t} group_id={group_id} username={u}"
+                 for u in usernames]
+        return [parse_resp(resp) for resp in self.pipeline(lines)]
+
     def group_remove(self, group_id: int, username: str, token: str = None) -> tuple:
         """GROUP_REMOVE -> OK"""
         rid = self.next_id()
@@ -353,10 +505,18 @@ class Conn:
         """PM_SEND (auto Base64) -> OK msg_id=..."""
         rid = self.next_id()
         t = token or self.token
-        content_b64 = b64_encode(content)
-        self.send_line(f"PM_SEND {rid} token={t} to={to_user} content={content_b64}")
+        # Build the frame as bytes: Base64 output is ASCII, no str round trip needed
+        head = f"PM_SEND {rid} token={t} to={to_user} content=".encode()
+        self.send_line(head + base64.b64encode(content.encode()))
         return parse_resp(self.recv_line())
 
+    def pm_send_many(self, to_user: str, contents: list, token: str = None) -> list:
+        """PM_SEND for several messages pipelined in one round trip -> one result per message"""
+        t = token or self.token
+        lines = [f"PM_SEND {self.next_id()} token={t} to={to_user} content={b64_encode(c)}"
+                 for c in contents]
+        return [parse_resp(resp) for resp in self.pipeline(lines)]
+
     def pm_send_raw(self, to_user: str, content_b64: str, token: str = None) -> tuple:
         """PM_SEND (raw Base64) -> OK msg_id=..."""
         rid = self.next_id()
@@ -398,8 +558,8 @@ class Conn:
         """GM_SEND (auto Base64) -> OK msg_id=..."""
         rid = self.next_id()
         t = token or self.token
-        content_b64 = b64_encode(content)
-        self.send_line(f"GM_SEND {rid} token={t} group_id={group_id} content={content_b64}")
+        head = f"GM_SEND {rid} token={t} group_id={group_id} content=".encode()
+        self.send_line(head + base64.b64encode(content.encode()))
         return parse_resp(self.recv_line())
 
     def gm_send_raw(self, group_id: int, content_b64: str, token: str = None) -> tuple:
@@ -419,35 +579,64 @@ class Conn:
 
 # ============ Server Management ============
 
-def start_server(port: int, timeout_s: int = 3600) -> subprocess.Popen:
-    """Start server and wait for it to be ready"""
+# Upper bound for the startup banner; slow CI hosts may need more than a few seconds
+STARTUP_TIMEOUT = 30.0
+
+# The server prints the port it actually bound, which matters when asked for port 0
+_BANNER_RE = re.compile(rb"Server listening on [^:\s]+:(\d+)")
+
+def start_server(port: int = 0, timeout_s: int = 3600, cwd: str = PROJECT_ROOT) -> tuple:
+    """
+    Start server and wait for it to be ready -> (proc, port).
+    port=0 lets the OS pick a free port at bind time, so there is no window in
+    which another process can take it. The server keeps its DB under ./data,
+    so `cwd` chooses the data directory.
+    """
     if not os.path.exists(SERVER_BIN):
         die(f"Server binary not found: {SERVER_BIN}")
 
+    # Binary pipe: we only look for a marker, so skip the text-mode decoder
     proc = subprocess.Popen(
         [SERVER_BIN, str(port), str(timeout_s)],
-        cwd=PROJECT_ROOT,
+        cwd=cwd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1,
     )
 
-    start = time.time()
-    output = []
-    while time.time() - start < 3:
-        if proc.poll() is not None:
-            out = "".join(output) + (proc.stdout.read() if proc.stdout else "")
-            die(f"Server exited early:\n{out}")
+    # A blocking read on a helper thread wakes as soon as the server prints,
+    # instead of polling stdout in 100ms select() slices.
+    ready = threading.Event()
+    output = bytearray()
 
-        if proc.stdout and select.select([proc.stdout], [], [], 0.1)[0]:
-            line = proc.stdout.readline()
-            if line:
-                output.append(line)
-                if "Server listening" in line:
-                    return proc
+    def watch_stdout():
+        fd = proc.stdout.fileno()
+        while True:
+            chunk = os.read(fd, 4096)
+            output.extend(chunk)
+            # EOF also wakes the waiter so the early exit is reported
+            if not chunk or _BANNER_RE.search(output):
+                ready.set()
+                break
+        # Keep draining (and discarding) until the server exits: a full 64KB
+        # pipe would block the server on its next printf
+        while os.read(fd, 4096):
+            pass
+
+    threading.Thread(target=watch_stdout, daemon=True).start()
+
+    # The banner is printed only after listen(), and EOF also sets `ready`,
+    # so this normally returns in milliseconds. The bound only catches a hung
+    # server instead of handing back a half-started one.
+    if not ready.wait(STARTUP_TIMEOUT):
+        stop_server(proc)
+        die(f"Server not ready after {STARTUP_TIMEOUT}s:\n{output.decode(errors='replace')}")
 
-    return proc
+    banner = _BANNER_RE.search(output)
+    if not banner:
+        proc.wait(timeout=2)
+        die(f"Server exited early:\n{output.decode(errors='replace')}")
+
+    return proc, int(banner.group(1))
 
 
 def stop_server(proc: subprocess.Popen):
@@ -460,99 +649,41 @@ def stop_server(proc: subprocess.Popen):
             proc.kill()
 
 
-# ============ Database Management ============
-
-DB_FILES = [
-    "users.db",
-    "friends.db", 
-    "groups.db",
-    "group_members.db",
-]
-
-DB_DIRS = [
-    "pm",
-    "gm",
-]
-
-
-def backup_data():
-    """Backup all data files"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    
-    # Backup files
-    for f in DB_FILES:
-        real = os.path.join(DATA_DIR, f)
-        bak = real + ".bak"
-        if os.path.exists(bak):
-            os.remove(bak)
-        if os.path.exists(real):
-            os.rename(real, bak)
-    
-    # Backup directories
-    import shutil
-    for d in DB_DIRS:
-        real = os.path.join(DATA_DIR, d)
-        bak = real + ".bak"
-        if os.path.exists(bak):
-            shutil.rmtree(bak)
-        if os.path.exists(real):
-            os.rename(real, bak)
-
-
-def restore_data():
-    """Restore all data files from backup"""
-    import shutil
-    
-    # Restore files
-    for f in DB_FILES:
-        real = os.path.join(DATA_DIR, f)
-        bak = real + ".bak"
-        if os.path.exists(real):
-            os.remove(real)
-        if os.path.exists(bak):
-            os.rename(bak, real)
-    
-    # Restore directories
-    for d in DB_DIRS:
-        real = os.path.join(DATA_DIR, d)
-        bak = real + ".bak"
-        if os.path.exists(real):
-            shutil.rmtree(real)
-        if os.path.exists(bak):
-            os.rename(bak, real)
-
-
-def clean_data():
-    """Remove all test data (without backup)"""
-    import shutil
-    
-    for f in DB_FILES:
-        path = os.path.join(DATA_DIR, f)
-        if os.path.exists(path):
-            os.remove(path)
-    
-    for d in DB_DIRS:
-        path = os.path.join(DATA_DIR, d)
-        if os.path.exists(path):
-            shutil.rmtree(path)
-
-
-def with_clean_db(fn):
-    """Decorator/wrapper to run test with clean database"""
-    backup_data()
+@contextmanager
+def running_server(timeout_s: int = 3600):
+    """
+    Start one server on an OS-assigned port for a whole test run and yield the port.
+    All suites share this instance; tests isolate themselves with unique usernames.
+    The server runs in a fresh temp directory, so the real data/ is never touched.
+    """
+    work_dir = tempfile.mkdtemp(prefix="chatapp-test-")
+    proc, port = start_server(0, timeout_s=timeout_s, cwd=work_dir)
     try:
-        fn()
+        yield port
     finally:
-        restore_data()
+        stop_server(proc)
+        shutil.rmtree(work_dir, ignore_errors=True)
 
 
 # ============ Test Runner ============
 
 class TestRunner:
-    """Simple test runner with stats"""
+    """
+    Simple test runner with stats.
+    Tests are independent (unique usernames per test), so they run concurrently
+    on a thread pool; results are still reported in declaration order.
+    Tests mostly wait on the network, so the pool is wider than the CPU count.
+    """
+    
+    __test__ = False  # not a pytest test class
+    
+    # Runner currently executing in this process; lets callers recover the
+    # counts after die() aborts run() with SystemExit
+    active = None
     
-    def __init__(self, name: str):
+    def __init__(self, name: str, workers: int = 16):
         self.name = name
+        self.workers = workers
         self.passed = 0
         self.failed = 0
         self.tests = []
@@ -562,21 +693,39 @@ class TestRunner:
         desc = description or test_fn.__name__
         self.tests.append((test_fn, desc))
     
+    @staticmethod
+    def _run_one(test_fn, port: int):
+        """
+        Run one test, then close every Conn it opened.
+        A failed assert skips the test's own close() calls, and the traceback
+        kept by the future would otherwise hold those sockets open.
+        """
+        _test_conns.conns = []
+        try:
+            test_fn(port)
+        finally:
+            for c in _test_conns.conns:
+                c.close()
+            _test_conns.conns = None
+    
     def run(self, port: int):
         """Run all tests"""
         section(f"Running: {self.name}")
+        TestRunner.active = self
         
-        for test_fn, desc in self.tests:
-            try:
-                test_fn(port)
-                self.passed += 1
-                ok(desc)
-            except AssertionError as e:
-                self.failed += 1
-                die(f"{desc}: {e}")
-            except Exception as e:
-                self.failed += 1
-                die(f"{desc}: {type(e).__name__}: {e}")
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [(pool.submit(self._run_one, test_fn, port), desc) for test_fn, desc in self.tests]
+            for future, desc in futures:
+                try:
+                    future.result()
+                    self.passed += 1
+                    ok(desc)
+                except AssertionError as e:
+                    self.failed += 1
+                    die(f"{desc}: {e}")
+                except Exception as e:
+                    self.failed += 1
+                    die(f"{desc}: {type(e).__name__}: {e}")
         
         return self.passed, self.failed
     